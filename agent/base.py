@@ -17,6 +17,14 @@ from CacheManage.manager import (
 )
 from CacheManage.strategies.global_strategy import GlobalCacheKeyStrategy
 
+# 答案验证时视为失败的错误消息
+_ANSWER_ERROR_PATTERNS = (
+    "抱歉，处理您的问题时遇到了错误",
+    "技术原因:",
+    "无法获取",
+    "无法回答这个问题"
+)
+
 class BaseAgent(ABC):
     """Agent 基类，定义通用功能和接口"""
     
@@ -722,14 +730,7 @@ class BaseAgent(ABC):
                 return False
                 
             # 检查是否包含错误消息
-            error_patterns = [
-                "抱歉，处理您的问题时遇到了错误",
-                "技术原因:",
-                "无法获取",
-                "无法回答这个问题"
-            ]
-            
-            for pattern in error_patterns:
+            for pattern in _ANSWER_ERROR_PATTERNS:
                 if pattern in answer:
                     return False
                     
@@ -5,6 +5,7 @@ from langchain.callbacks.manager import AsyncCallbackManager
 
 
 import os
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -53,6 +54,18 @@ def get_stream_llm_model():
     )
     return model
 
+@lru_cache(maxsize=1)
+def _deepseek_tokenizer():
+    """加载一次deepseek分词器，后续计数直接复用"""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained("deepseek-ai/DeepSeek-V3")
+
+@lru_cache(maxsize=1)
+def _tiktoken_encoding():
+    """加载一次tiktoken编码，后续计数直接复用"""
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
+
 def count_tokens(text):
     """简单通用的token计数"""
     if not text:
@@ -63,18 +76,14 @@ def count_tokens(text):
     # 如果是deepseek，使用transformers
     if 'deepseek' in model_name:
         try:
-            from transformers import AutoTokenizer
-            tokenizer = AutoTokenizer.from_pretrained("deepseek-ai/DeepSeek-V3")
-            return len(tokenizer.encode(text))
+            return len(_deepseek_tokenizer().encode(text))
         except:
             pass
     
     # 如果是gpt，使用tiktoken
     if 'gpt' in model_name:
         try:
-            import tiktoken
-            encoding = tiktoken.get_encoding("cl100k_base")
-            return len(encoding.encode(text))
+            return len(_tiktoken_encoding().encode(text))
         except:
             pass
     
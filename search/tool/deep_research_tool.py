@@ -3,7 +3,10 @@ import time
 import re
 import logging
 import json
+import ast
 import traceback
+import threading
+from collections import OrderedDict
 from langchain_core.tools import BaseTool
 from langchain_core.messages import SystemMessage, HumanMessage
 import asyncio
@@ -21,6 +24,17 @@ from search.tool.reasoning.validator import AnswerValidator
 from search.tool.reasoning.search import DualPathSearcher, QueryGenerator
 from config.settings import KB_NAME
 
+# 从非JSON的搜索结果中提取字典字面量，依次尝试
+_JSON_PATTERNS = (
+    re.compile(r'{\s*"data"\s*:\s*(\{.*\})\s*}', re.DOTALL),  # {"data": {...}}
+    re.compile(r'(\{.*\})', re.DOTALL),                       # {...}
+)
+_CHUNKS_RE = re.compile(r'Chunks\s*:\s*\[(.*?)\]', re.DOTALL)
+# 流式输出的分块和思考标签清理
+_PARAGRAPH_SPLIT_RE = re.compile(r'(\n\n)')
+_SENTENCE_SPLIT_RE = re.compile(r'([.!?。！？]\s*)')
+_THINK_BLOCK_RE = re.compile(r'<think>.*?</think>\s*', re.DOTALL)
+
 
 class DeepResearchTool(BaseSearchTool):
     """
@@ -38,13 +52,18 @@ class DeepResearchTool(BaseSearchTool):
         """初始化深度研究工具"""
         super().__init__(cache_dir="./cache/deep_research")
 
-        # 关键词缓存
-        self._keywords_cache = {}
+        # 关键词缓存（LRU），流式调用不会重置缓存，需限制容量
+        self._keywords_cache = OrderedDict()
+        self.max_keywords_cache = 1000
+        # 检索线程和执行器线程会并发读写缓存
+        self._keywords_cache_lock = threading.Lock()
         
         # 初始化各种工具，用于不同阶段的搜索
         self.hybrid_tool = HybridSearchTool()  # 用于关键词提取和混合搜索
-        self.global_tool = GlobalSearchTool()  # 用于社区检索
-        self.local_tool = LocalSearchTool()    # 用于本地搜索
+        # 社区检索和本地搜索工具只在检索时用到，首次使用时再创建
+        self._global_tool = None
+        self._local_tool = None
+        self._tools_lock = threading.Lock()
         
         # 初始化思考引擎
         self.thinking_engine = ThinkingEngine(self.llm)
@@ -65,7 +84,8 @@ class DeepResearchTool(BaseSearchTool):
         self.dual_searcher = DualPathSearcher(
             self._kb_retrieve, 
             self._kg_retrieve, 
-            KB_NAME
+            KB_NAME,
+            log_func=self._log
         )
         
         # 存储重要信息
@@ -82,16 +102,40 @@ class DeepResearchTool(BaseSearchTool):
         # 深度研究工具主要依赖于其他工具的功能和思考方法
         pass
     
+    @property
+    def global_tool(self) -> GlobalSearchTool:
+        """用于社区检索的全局搜索工具"""
+        if self._global_tool is None:
+            with self._tools_lock:
+                if self._global_tool is None:
+                    self._global_tool = GlobalSearchTool()
+        return self._global_tool
+    
+    @property
+    def local_tool(self) -> LocalSearchTool:
+        """用于知识库检索的本地搜索工具"""
+        if self._local_tool is None:
+            with self._tools_lock:
+                if self._local_tool is None:
+                    self._local_tool = LocalSearchTool()
+        return self._local_tool
+    
     def extract_keywords(self, query: str) -> Dict[str, List[str]]:
         """从查询中提取关键词"""
         # 检查缓存
-        if query in self._keywords_cache:
-            return self._keywords_cache[query]
+        with self._keywords_cache_lock:
+            if query in self._keywords_cache:
+                self._keywords_cache.move_to_end(query)
+                return self._keywords_cache[query]
 
+        # 提取关键词需要调用LLM，不持有锁
         keywords = self.hybrid_tool.extract_keywords(query)
         
-        # 缓存结果
-        self._keywords_cache[query] = keywords
+        # 缓存结果，超出容量时淘汰最久未使用的条目
+        with self._keywords_cache_lock:
+            self._keywords_cache[query] = keywords
+            while len(self._keywords_cache) > self.max_keywords_cache:
+                self._keywords_cache.popitem(last=False)
         return keywords
     
     def _parse_search_result(self, result):
@@ -110,23 +154,18 @@ class DeepResearchTool(BaseSearchTool):
         
         # 字符串结果需要解析
         if isinstance(result, str):
-            # 尝试JSON解析
-            try:
-                return json.loads(result)
-            except json.JSONDecodeError:
-                pass
+            # 只有看起来像JSON对象的结果才尝试解析，纯文本结果不必走异常流程
+            if result.lstrip().startswith("{"):
+                try:
+                    return json.loads(result)
+                except json.JSONDecodeError:
+                    pass
             
             # 使用正则表达式提取JSON对象
-            json_patterns = [
-                r'{\s*"data"\s*:\s*(\{.*\})\s*}',  # {"data": {...}}
-                r'(\{.*\})',                       # {...}
-            ]
-            
-            for pattern in json_patterns:
-                matches = re.search(pattern, result, re.DOTALL)
+            for pattern in _JSON_PATTERNS:
+                matches = pattern.search(result)
                 if matches:
                     try:
-                        import ast
                         extracted = matches.group(1)
                         parsed = ast.literal_eval(extracted)
                         return {"data": parsed}
@@ -134,8 +173,7 @@ class DeepResearchTool(BaseSearchTool):
                         continue
             
             # 尝试提取Chunk IDs
-            chunks_pattern = r'Chunks\s*:\s*\[(.*?)\]'
-            chunks_match = re.search(chunks_pattern, result, re.DOTALL)
+            chunks_match = _CHUNKS_RE.search(result)
             if chunks_match:
                 try:
                     chunk_text = chunks_match.group(1)
@@ -386,11 +424,19 @@ class DeepResearchTool(BaseSearchTool):
     
     async def _async_generate_next_query(self):
         """异步生成下一个查询"""
-        def sync_generate():
-            return self.thinking_engine.generate_next_query()
-            
-        # 在线程池中运行同步代码，避免阻塞事件循环
-        return await asyncio.get_event_loop().run_in_executor(None, sync_generate)
+        return await self.thinking_engine.agenerate_next_query()
+
+    def _prefetch_queries(self, queries: List[str]):
+        """
+        处理一轮查询前，一次性提交其中所有未执行查询的检索，
+        之后逐个执行search时直接复用已在后台进行的检索
+        
+        参数:
+            queries: 本轮待处理的查询列表
+        """
+        for search_query in queries:
+            if not self.thinking_engine.has_executed_query(search_query):
+                self.dual_searcher.prefetch(search_query)
 
     async def _async_search(self, query: str):
         """异步执行搜索，避免阻塞事件循环"""
@@ -444,7 +490,11 @@ class DeepResearchTool(BaseSearchTool):
         self.execution_logs = []
         self._log(f"\n[深度研究] 开始处理查询: {query}")
 
-        self._keywords_cache = {}
+        with self._keywords_cache_lock:
+            self._keywords_cache.clear()
+        
+        # 新的研究不复用上一次研究的检索结果
+        self.dual_searcher.reset()
         
         # 初始化结果容器
         chunk_info = {"chunks": [], "doc_aggs": []}
@@ -548,6 +598,9 @@ class DeepResearchTool(BaseSearchTool):
                     self._log("\n[深度研究] 没有生成新查询且已有信息，结束迭代")
                     break
             
+            # 本轮所有查询的检索一次性提交，逐个处理时复用
+            self._prefetch_queries(queries_to_process)
+            
             # 处理每个搜索查询
             for search_query in queries_to_process:
                 self._log(f"\n[深度研究] 执行查询: {search_query}")
@@ -671,7 +724,7 @@ class DeepResearchTool(BaseSearchTool):
         返回:
             str: 搜索结果
         """
-        overall_start = time.time()
+        overall_start = time.monotonic()
         
         # 记录开始搜索
         self._log(f"\n[深度搜索] 开始处理查询...")
@@ -720,7 +773,7 @@ class DeepResearchTool(BaseSearchTool):
                 self._log(f"\n[深度搜索] 答案验证失败，不缓存")
             
             # 记录总时间
-            total_time = time.time() - overall_start
+            total_time = time.monotonic() - overall_start
             self._log(f"\n[深度搜索] 完成，耗时 {total_time:.2f}秒")
             self.performance_metrics["total_time"] = total_time
             
@@ -780,6 +833,9 @@ class DeepResearchTool(BaseSearchTool):
         self.execution_logs = []
         self._log(f"\n[深度研究] 开始处理查询: {query}")
         
+        # 新的研究不复用上一次研究的检索结果
+        self.dual_searcher.reset()
+        
         # 初始化结果容器
         chunk_info = {"chunks": [], "doc_aggs": []}
         self.all_retrieved_info = []
@@ -791,10 +847,7 @@ class DeepResearchTool(BaseSearchTool):
         yield "\n**正在分析您的问题，生成研究方向**...\n"
         
         # 异步生成子查询
-        def generate_sub_queries():
-            return self.query_generator.generate_sub_queries(query)
-        
-        initial_sub_queries = await asyncio.get_event_loop().run_in_executor(None, generate_sub_queries)
+        initial_sub_queries = await self.query_generator.agenerate_sub_queries(query)
         self._log(f"\n[深度研究] 生成了{len(initial_sub_queries)}个初始子查询")
         
         think = ""
@@ -886,7 +939,7 @@ class DeepResearchTool(BaseSearchTool):
                     think += think_part
                     
                     # 分组返回思考内容，提高可读性
-                    thoughts = re.split(r'(\n\n)', think_part)
+                    thoughts = _PARAGRAPH_SPLIT_RE.split(think_part)
                     thought_buffer = ""
                     
                     for part in thoughts:
@@ -937,6 +990,9 @@ class DeepResearchTool(BaseSearchTool):
                     yield end_msg
                     break
             
+            # 本轮所有查询的检索一次性提交，逐个处理时复用
+            self._prefetch_queries(queries_to_process)
+            
             # 处理每个搜索查询
             for search_query in queries_to_process:
                 search_start_msg = f"\n**正在搜索: {search_query}**\n"
@@ -1018,7 +1074,7 @@ class DeepResearchTool(BaseSearchTool):
                 think += self.thinking_engine.remove_result_tags(summary_think)
                     
                 # 分组返回处理后的思考内容
-                result_parts = re.split(r'(\n\n)', self.thinking_engine.remove_result_tags(summary_think))
+                result_parts = _PARAGRAPH_SPLIT_RE.split(self.thinking_engine.remove_result_tags(summary_think))
                 result_buffer = ""
                 
                 for part in result_parts:
@@ -1073,7 +1129,7 @@ class DeepResearchTool(BaseSearchTool):
         返回:
             AsyncGenerator: 流式输出
         """
-        overall_start = time.time()
+        overall_start = time.monotonic()
         
         # 记录开始搜索
         self._log(f"\n[深度搜索] 开始处理查询...")
@@ -1092,7 +1148,7 @@ class DeepResearchTool(BaseSearchTool):
         if cached_result:
             self._log(f"\n[深度搜索] 缓存命中，分块返回缓存结果")
             # 分块返回缓存结果 - 更自然的分块
-            chunks = re.split(r'([.!?。！？]\s*)', cached_result)
+            chunks = _SENTENCE_SPLIT_RE.split(cached_result)
             buffer = ""
             
             for i in range(0, len(chunks)):
@@ -1132,7 +1188,7 @@ class DeepResearchTool(BaseSearchTool):
                         
                         # 将思考过程和最终答案分离
                         if "<think>" in full_response and "</think>" in full_response:
-                            clean_answer = re.sub(r'<think>.*?</think>\s*', '', full_response, flags=re.DOTALL)
+                            clean_answer = _THINK_BLOCK_RE.sub('', full_response)
                             yield clean_answer
                         else:
                             yield full_response
@@ -1148,7 +1204,7 @@ class DeepResearchTool(BaseSearchTool):
                     yield chunk
             
             # 记录总时间
-            total_time = time.time() - overall_start
+            total_time = time.monotonic() - overall_start
             self._log(f"\n[深度搜索] 完成，耗时 {total_time:.2f}秒")
             self.performance_metrics["total_time"] = total_time
                 
@@ -1212,10 +1268,15 @@ class DeepResearchTool(BaseSearchTool):
         # 调用父类方法
         super().close()
         
+        # 关闭双路径搜索器的常驻线程池
+        if hasattr(self, 'dual_searcher'):
+            self.dual_searcher.close()
+        
         # 关闭复用的工具资源
         if hasattr(self, 'hybrid_tool'):
             self.hybrid_tool.close()
-        if hasattr(self, 'global_tool'):
-            self.global_tool.close()
-        if hasattr(self, 'local_tool'):
-            self.local_tool.close()
\ No newline at end of file
+        # 只关闭已经创建过的工具
+        if getattr(self, '_global_tool', None) is not None:
+            self._global_tool.close()
+        if getattr(self, '_local_tool', None) is not None:
+            self._local_tool.close()
\ No newline at end of file
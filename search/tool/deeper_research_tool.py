@@ -5,6 +5,8 @@ import traceback
 import asyncio
 import re
 import os
+import threading
+from collections import OrderedDict
 
 from langchain_core.tools import BaseTool
 
@@ -48,8 +50,11 @@ class DeeperResearchTool:
             embeddings: 嵌入模型
             graph: 图数据库连接
         """
-        # 关键词缓存
-        self._keywords_cache = {}
+        # 关键词缓存（LRU），流式调用不会重置缓存，需限制容量
+        self._keywords_cache = OrderedDict()
+        self.max_keywords_cache = 1000
+        # 检索线程和执行器线程会并发读写缓存
+        self._keywords_cache_lock = threading.Lock()
 
         # 初始化基础组件
         self.llm = llm or get_llm_model()
@@ -136,13 +141,19 @@ class DeeperResearchTool:
     def extract_keywords(self, query: str) -> Dict[str, List[str]]:
         """从查询中提取关键词"""
         # 检查缓存
-        if query in self._keywords_cache:
-            return self._keywords_cache[query]
+        with self._keywords_cache_lock:
+            if query in self._keywords_cache:
+                self._keywords_cache.move_to_end(query)
+                return self._keywords_cache[query]
 
+        # 提取关键词需要调用LLM，不持有锁
         keywords = self.hybrid_tool.extract_keywords(query)
         
-        # 缓存结果
-        self._keywords_cache[query] = keywords
+        # 缓存结果，超出容量时淘汰最久未使用的条目
+        with self._keywords_cache_lock:
+            self._keywords_cache[query] = keywords
+            while len(self._keywords_cache) > self.max_keywords_cache:
+                self._keywords_cache.popitem(last=False)
         return keywords
     
     def _enhance_search_with_coe(self, query: str, keywords: Dict[str, List[str]]):
@@ -476,7 +487,8 @@ class DeeperResearchTool:
         self.execution_logs = []
         self._log(f"\n[深度研究] 开始处理查询: {query}")
 
-        self._keywords_cache = {}
+        with self._keywords_cache_lock:
+            self._keywords_cache.clear()
         
         # 检查思考缓存
         if hasattr(self, '_thinking_cache') and query in self._thinking_cache:
@@ -611,9 +623,10 @@ class DeeperResearchTool:
         exploration_results = community_context.get("exploration_results", {})
         exploration_path = exploration_results.get("exploration_path", [])
         
-        # 初始化结果容器
+        # 初始化结果容器，新的研究不复用上一次研究的检索结果
         think = ""
         self.deep_research.all_retrieved_info = []
+        self.deep_research.dual_searcher.reset()
         
         # 收集从探索中获取的内容
         exploration_content = []
@@ -859,6 +872,9 @@ class DeeperResearchTool:
                     
                     break
             
+            # 本轮所有查询的检索一次性提交，逐个处理时复用
+            self.deep_research._prefetch_queries(queries_to_process)
+            
             # 处理每个搜索查询
             for search_query in queries_to_process:
                 self._log(f"\n[深度研究] 执行查询: {search_query}")
@@ -942,6 +958,10 @@ class DeeperResearchTool:
                 
                 # 为查询结果更新知识图谱
                 if "chunks" in kbinfos:
+                    # 待提取实体关系的chunk，收集后一次并发提取
+                    pending_extractions = []
+                    queued_chunk_ids = set()
+                    
                     for chunk in kbinfos.get("chunks", []):
                         chunk_id = chunk.get("chunk_id", "")
                         chunk_text = chunk.get("text", "")
@@ -960,19 +980,24 @@ class DeeperResearchTool:
                             if (hasattr(self.knowledge_builder, 'extractor') and 
                                 self.knowledge_builder.extractor and 
                                 chunks_count < 5):  # 只有当chunks数量较少时才提取
-                                try:
-                                    extract_cache_key = f"extract:{chunk_id}"
-                                    if not hasattr(self, '_extract_cache'):
-                                        self._extract_cache = {}
-                                        
-                                    if extract_cache_key not in self._extract_cache:
-                                        self.knowledge_builder.extract_subgraph_from_chunk(
-                                            chunk_text, 
-                                            chunk_id
-                                        )
-                                        self._extract_cache[extract_cache_key] = True
-                                except Exception as e:
-                                    self._log(f"\n[深度研究] 提取实体关系失败: {e}")
+                                extract_cache_key = f"extract:{chunk_id}"
+                                if not hasattr(self, '_extract_cache'):
+                                    self._extract_cache = {}
+                                    
+                                # 同一批次中重复出现的chunk只提取一次
+                                if (extract_cache_key not in self._extract_cache and
+                                        chunk_id not in queued_chunk_ids):
+                                    pending_extractions.append((chunk_text, chunk_id))
+                                    queued_chunk_ids.add(chunk_id)
+                    
+                    if pending_extractions:
+                        try:
+                            extracted_ids = self.knowledge_builder.extract_subgraphs_from_chunks(pending_extractions)
+                            # 只标记提取成功的chunk，失败的chunk之后还可以重试
+                            for extracted_id in extracted_ids:
+                                self._extract_cache[f"extract:{extracted_id}"] = True
+                        except Exception as e:
+                            self._log(f"\n[深度研究] 提取实体关系失败: {e}")
                 
                 # 检查搜索结果是否为空
                 has_results = (
@@ -1311,7 +1336,7 @@ class DeeperResearchTool:
         Returns:
             str: 搜索结果
         """
-        overall_start = time.time()
+        overall_start = time.monotonic()
         
         # 记录开始搜索
         self._log(f"\n[深度搜索] 开始处理查询...")
@@ -1378,7 +1403,7 @@ class DeeperResearchTool:
                 self._log(f"\n[深度搜索] 答案验证失败，不缓存")
             
             # 记录总时间
-            total_time = time.time() - overall_start
+            total_time = time.monotonic() - overall_start
             self._log(f"\n[深度搜索] 完成，耗时 {total_time:.2f}秒")
             self.performance_metrics["total_time"] = total_time
             
@@ -1535,7 +1560,7 @@ class DeeperResearchTool:
         Yields:
             流式内容
         """
-        overall_start = time.time()
+        overall_start = time.monotonic()
         
         # 记录开始搜索
         self._log(f"\n[深度搜索] 开始处理查询...")
@@ -1638,7 +1663,7 @@ class DeeperResearchTool:
                     yield chunk
             
             # 记录总时间
-            total_time = time.time() - overall_start
+            total_time = time.monotonic() - overall_start
             self._log(f"\n[深度搜索] 完成，耗时 {total_time:.2f}秒")
             self.performance_metrics["total_time"] = total_time
                 
@@ -1658,12 +1683,15 @@ class DeeperResearchTool:
         Yields:
             思考步骤和最终答案
         """
-        overall_start = time.time()
+        overall_start = time.monotonic()
         
         # 清空执行日志
         self.execution_logs = []
         self._log(f"\n[深度研究] 开始处理查询: {query}")
         
+        # 新的研究不复用上一次研究的检索结果
+        self.deep_research.dual_searcher.reset()
+        
         # 向用户发送初始状态消息
         yield "\n**正在分析您的问题**...\n"
         
@@ -2031,6 +2059,9 @@ class DeeperResearchTool:
                     )
                     break
             
+            # 本轮所有查询的检索一次性提交，逐个处理时复用
+            self.deep_research._prefetch_queries(queries_to_process)
+            
             # 处理每个搜索查询
             for search_query in queries_to_process:
                 search_start_msg = f"\n**正在搜索: {search_query}**\n"
@@ -1,4 +1,4 @@
-from search.tool.reasoning.nlp import extract_between, extract_from_templates, extract_sentences
+from search.tool.reasoning.nlp import extract_between, extract_from_templates, extract_sentences, response_text
 from search.tool.reasoning.prompts import kb_prompt, num_tokens_from_string
 from search.tool.reasoning.thinking import ThinkingEngine
 from search.tool.reasoning.validator import AnswerValidator
@@ -11,6 +11,7 @@ __all__ = [
     "extract_between",
     "extract_from_templates",
     "extract_sentences",
+    "response_text",
     "kb_prompt",
     "num_tokens_from_string",
     "ThinkingEngine",
@@ -5,6 +5,17 @@ import time
 import asyncio
 import pandas as pd
 import re
+import json
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 解析LLM回复的模式
+_JSON_OBJECT_RE = re.compile(r'{.*}', re.DOTALL)
+_DECISION_ENTITIES_RE = re.compile(r'实体:\s*\[(.*?)\]', re.DOTALL)
+_DECISION_REASONING_RE = re.compile(r'推理:(.*?)($|```)', re.DOTALL)
 
 class ChainOfExplorationSearcher:
     """
@@ -13,6 +24,15 @@ class ChainOfExplorationSearcher:
     实现多步自主探索图谱的能力，具有适应性搜索宽度、记忆机制和路径优化功能
     """
     
+    # 识别复杂问题的关键词(已是小写形式)
+    _COMPLEXITY_INDICATORS = (
+        "为什么", "如果", "原因", "关系", "比较", "区别",
+        "影响", "分析", "评估", "预测"
+    )
+    # 所有关键词合并为一个模式，一次扫描找出查询中出现的关键词
+    # (关键词之间首尾不重叠，非重叠匹配不会漏掉任何关键词)
+    _COMPLEXITY_INDICATOR_RE = re.compile("|".join(map(re.escape, _COMPLEXITY_INDICATORS)))
+    
     def __init__(self, graph, llm, embeddings_model):
         """
         初始化Chain of Exploration检索器
@@ -27,8 +47,23 @@ class ChainOfExplorationSearcher:
         self.embeddings = embeddings_model
         self.visited_nodes = set()
         self.exploration_path = []
-        self.exploration_memory = {}  # 存储已探索路径的记忆
+        self.exploration_memory = OrderedDict()  # 存储已探索路径的记忆
+        self.max_memory_entries = 256  # 记忆条目上限，超出时淘汰最早的条目
+        self.neighbor_limit = 100  # 每步最多取回的邻居数，按关系权重从高到低截取
         self.performance_metrics = {}
+        # 最近一次查询的复杂度 (query, complexity)，查询在各探索步骤间不变
+        self._complexity_cache = (None, None)
+        # 实体类型缓存(LRU)，跨探索复用，重复访问的邻居无需再查图
+        self._entity_type_cache = OrderedDict()
+        self.max_cached_types = 4096
+        # 探索策略缓存(LRU)，键为(查询, 起始实体)
+        self._strategy_cache = OrderedDict()
+        self.max_cached_strategies = 128
+    
+    def close(self):
+        """清空跨探索复用的缓存"""
+        self._entity_type_cache.clear()
+        self._strategy_cache.clear()
     
     def explore(self, query: str, starting_entities: List[str], max_steps: int = 5, exploration_width: int = 3):
         """
@@ -43,7 +78,7 @@ class ChainOfExplorationSearcher:
         Returns:
             Dict: 探索结果
         """
-        start_time = time.time()
+        start_time = time.monotonic()
         
         if not starting_entities:
             return {
@@ -59,17 +94,14 @@ class ChainOfExplorationSearcher:
         query_embedding = self.embeddings.embed_query(query)
         
         # 添加起始节点到探索路径
-        for entity in starting_entities:
-            self.exploration_path.append({
-                "step": 0,
-                "node_id": entity,
-                "action": "start",
-                "reasoning": "初始实体"
-            })
+        self.exploration_path.extend(
+            {"step": 0, "node_id": entity, "action": "start", "reasoning": "初始实体"}
+            for entity in starting_entities
+        )
         
         # 根据查询内容生成探索策略
         exploration_strategy = self._generate_exploration_strategy(query, starting_entities)
-        self.performance_metrics["strategy_generation_time"] = time.time() - start_time
+        self.performance_metrics["strategy_generation_time"] = time.monotonic() - start_time
         
         current_entities = starting_entities
         results = {
@@ -78,79 +110,82 @@ class ChainOfExplorationSearcher:
             "content": [],
             "communities": []
         }
+        # 已收集的内容ID，随每步追加增量维护，避免同一chunk被重复收集和嵌入
+        seen_content_ids = set()
         
-        # 多步探索
-        for step in range(max_steps):
-            step_start_time = time.time()
+        # 多步探索；新实体的信息、关系、内容查询互不依赖，在本次探索内并发发往图数据库，
+        # 线程池随探索结束关闭，不依赖调用方释放
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="coe-fetch") as fetch_pool:
+            for step in range(max_steps):
+                step_start_time = time.monotonic()
             
-            if not current_entities:
-                break
+                if not current_entities:
+                    break
                 
-            # 1. 找出邻居节点
-            neighbors = self._get_neighbors(current_entities)
-            if not neighbors:
-                break
+                # 1. 找出邻居节点
+                neighbors = self._get_neighbors(current_entities)
+                if not neighbors:
+                    break
                 
-            # 2. 动态宽度控制
-            current_width = self._calculate_adaptive_width(
-                step, 
-                query, 
-                neighbors, 
-                base_width=exploration_width
-            )
-            
-            # 3. 评估每个邻居与查询的相关性
-            scored_neighbors = self._score_neighbors_enhanced(
-                neighbors, 
-                query, 
-                query_embedding,
-                exploration_strategy
-            )
-            
-            # 4. 让LLM决定探索方向
-            next_entities, reasoning = self._decide_next_step_with_memory(
-                query, 
-                current_entities, 
-                scored_neighbors, 
-                current_width,
-                step
-            )
-            
-            # 5. 更新已访问节点
-            new_entities = [e for e in next_entities if e not in self.visited_nodes]
-            self.visited_nodes.update(new_entities)
-            
-            # 6. 获取新发现实体的内容
-            entity_info = self._get_entity_info(new_entities)
-            results["entities"].extend(entity_info)
-            
-            # 7. 收集关系信息
-            rel_info = self._get_relationship_info(new_entities)
-            results["relationships"].extend(rel_info)
-            
-            # 8. 收集内容信息（如chunk）
-            content_info = self._get_content_info(new_entities)
-            results["content"].extend(content_info)
-            
-            # 9. 尝试获取所属社区信息
-            community_info = self._get_community_info(new_entities)
-            if community_info:
-                results["communities"].extend(community_info)
-            
-            # 10. 记录探索路径
-            for entity in new_entities:
-                self.exploration_path.append({
-                    "step": step + 1,
-                    "node_id": entity,
-                    "action": "explore",
-                    "reasoning": reasoning
-                })
-            
-            # 11. 更新当前实体
-            current_entities = new_entities
-            
-            # 记录每步耗时
-            self.performance_metrics[f"step_{step+1}_time"] = time.time() - step_start_time
+                # 2. 动态宽度控制
+                current_width = self._calculate_adaptive_width(
+                    step, 
+                    query, 
+                    neighbors, 
+                    base_width=exploration_width
+                )
+            
+                # 3. 评估每个邻居与查询的相关性
+                scored_neighbors = self._score_neighbors_enhanced(
+                    neighbors, 
+                    query, 
+                    query_embedding,
+                    exploration_strategy,
+                    top_k=10  # 决策时最多只展示前10个选项
+                )
+            
+                # 4. 让LLM决定探索方向
+                next_entities, reasoning = self._decide_next_step_with_memory(
+                    query, 
+                    current_entities, 
+                    scored_neighbors, 
+                    current_width,
+                    step
+                )
+            
+                # 5. 更新已访问节点(同时去掉LLM重复选择的实体)
+                new_entities = [e for e in dict.fromkeys(next_entities) if e not in self.visited_nodes]
+                self.visited_nodes.update(new_entities)
+            
+                # 6-8. 并发获取新实体的内容及所属社区、关系信息和内容信息（如chunk）
+                entity_future = fetch_pool.submit(self._get_entity_and_community_info, new_entities)
+                rel_future = fetch_pool.submit(self._get_relationship_info, new_entities)
+                content_future = fetch_pool.submit(self._get_content_info, new_entities)
+            
+                entity_info, community_info = entity_future.result()
+                results["entities"].extend(entity_info)
+                results["relationships"].extend(rel_future.result())
+                for content in content_future.result():
+                    content_id = content.get("id")
+                    if content_id is None or content_id not in seen_content_ids:
+                        seen_content_ids.add(content_id)
+                        results["content"].append(content)
+            
+                # 9. 记录所属社区信息
+                if community_info:
+                    results["communities"].extend(community_info)
+            
+                # 10. 记录探索路径
+                self.exploration_path.extend(
+                    {"step": step + 1, "node_id": entity, "action": "explore", "reasoning": reasoning}
+                    for entity in new_entities
+                )
+            
+                # 11. 更新当前实体
+                current_entities = new_entities
+            
+                # 记录每步耗时
+                self.performance_metrics[f"step_{step+1}_time"] = time.monotonic() - step_start_time
         
         # 根据查询对所有收集的内容进行最终排序
         results["content"] = self._rank_content_by_relevance(query_embedding, results["content"])
@@ -166,7 +201,7 @@ class ChainOfExplorationSearcher:
         }
         
         # 记录总耗时
-        self.performance_metrics["total_time"] = time.time() - start_time
+        self.performance_metrics["total_time"] = time.monotonic() - start_time
         results["performance_metrics"] = self.performance_metrics
         
         return results
@@ -182,6 +217,13 @@ class ChainOfExplorationSearcher:
         Returns:
             Dict: 探索策略
         """
+        # 相同查询和起始实体的策略直接复用，省去一次LLM调用
+        cache_key = (query, tuple(starting_entities))
+        cached_strategy = self._strategy_cache.get(cache_key)
+        if cached_strategy is not None:
+            self._strategy_cache.move_to_end(cache_key)
+            return cached_strategy
+        
         prompt = f"""
         为以下查询生成图谱探索策略，从给定的起始实体开始探索:
         
@@ -208,12 +250,14 @@ class ChainOfExplorationSearcher:
             content = response.content if hasattr(response, 'content') else str(response)
             
             # 提取JSON部分
-            import re
-            import json
-            
-            json_match = re.search(r'{.*}', content, re.DOTALL)
+            json_match = _JSON_OBJECT_RE.search(content)
             if json_match:
                 strategy = json.loads(json_match.group(0))
+                
+                # 只缓存成功解析的策略，超出容量时淘汰最久未使用的条目
+                self._strategy_cache[cache_key] = strategy
+                while len(self._strategy_cache) > self.max_cached_strategies:
+                    self._strategy_cache.popitem(last=False)
                 return strategy
             
             # 如果无法解析，返回默认策略
@@ -225,7 +269,7 @@ class ChainOfExplorationSearcher:
                 "relation_weights": {}
             }
         except Exception as e:
-            print(f"生成探索策略失败: {e}")
+            logger.error("生成探索策略失败: %s", e)
             # 默认策略
             return {
                 "focus_relations": [],
@@ -254,8 +298,11 @@ class ChainOfExplorationSearcher:
         # 邻居节点数量因素 - 邻居越多，宽度越大但有上限
         neighbor_factor = min(1.5, len(neighbors) / 10)
         
-        # 查询复杂度因素
-        complexity_factor = self._estimate_query_complexity(query)
+        # 查询复杂度因素 - 同一查询只估计一次
+        cached_query, complexity_factor = self._complexity_cache
+        if cached_query != query:
+            complexity_factor = self._estimate_query_complexity(query)
+            self._complexity_cache = (query, complexity_factor)
         
         # 计算最终宽度
         adjusted_width = int(base_width * step_factor * neighbor_factor * complexity_factor)
@@ -278,14 +325,8 @@ class ChainOfExplorationSearcher:
         question_marks = query.count("?") + query.count("？")
         question_factor = 1.0 + (question_marks * 0.1)
         
-        # 识别复杂问题的关键词
-        complexity_indicators = [
-            "为什么", "如果", "原因", "关系", "比较", "区别",
-            "影响", "分析", "评估", "预测"
-        ]
-        
-        # 检查关键词
-        indicator_count = sum(1 for indicator in complexity_indicators if indicator.lower() in query.lower())
+        # 检查关键词，统计出现过的不同关键词个数
+        indicator_count = len(set(self._COMPLEXITY_INDICATOR_RE.findall(query.lower())))
         indicator_factor = 1.0 + (indicator_count * 0.1)
         
         # 综合评分,基础值0.5,最大1.5
@@ -311,12 +352,14 @@ class ChainOfExplorationSearcher:
                    type(r) AS relation_type, startNode(r).id AS source,
                    endNode(r).id AS target,
                    CASE WHEN r.weight IS NOT NULL THEN r.weight ELSE 1.0 END AS weight
-            LIMIT 100
+            ORDER BY weight DESC
+            LIMIT $limit
             """
             
             params = {
                 "entity_ids": entities, 
-                "visited_ids": list(self.visited_nodes)
+                "visited_ids": list(self.visited_nodes),
+                "limit": self.neighbor_limit
             }
             
             result = self.graph.query(query, params=params)
@@ -333,10 +376,10 @@ class ChainOfExplorationSearcher:
                 return result
                 
         except Exception as e:
-            print(f"获取邻居节点失败: {e}")
+            logger.error("获取邻居节点失败: %s", e)
             return []
     
-    def _score_neighbors_enhanced(self, neighbors, query, query_embedding, exploration_strategy):
+    def _score_neighbors_enhanced(self, neighbors, query, query_embedding, exploration_strategy, top_k=None):
         """
         增强版邻居评分，考虑策略权重、相似度和关系权重
         
@@ -345,79 +388,107 @@ class ChainOfExplorationSearcher:
             query: 查询字符串
             query_embedding: 查询嵌入向量
             exploration_strategy: 探索策略
+            top_k: 只返回得分最高的前k个，None表示返回全部
             
         Returns:
-            List: 评分后的邻居列表
+            List: 按得分降序排列的邻居列表
         """
-        scored_neighbors = []
         relation_weights = exploration_strategy.get("relation_weights", {})
-        focus_relations = exploration_strategy.get("focus_relations", [])
-        focus_entity_types = exploration_strategy.get("focus_entity_types", [])
-        avoid_relations = exploration_strategy.get("avoid_relations", [])
-        
-        for neighbor in neighbors:
-            # 构建描述文本
-            description = neighbor.get('description', '')
-            relation_type = neighbor.get('relation_type', '')
-            neighbor_id = neighbor.get('id', '')
-            
-            # 初始权重 - 基础值0.5
-            base_weight = 0.5
-            
-            try:
-                # 计算语义相似度
-                if description:
-                    neighbor_embedding = self.embeddings.embed_query(description)
-                    similarity = cosine_similarity(
-                        np.array(query_embedding).reshape(1, -1),
-                        np.array(neighbor_embedding).reshape(1, -1)
-                    )[0][0]
-                else:
-                    similarity = 0.0
-                    
-                # 获取关系权重
-                relation_weight = relation_weights.get(relation_type, 1.0)
-                
-                # 计算策略匹配分数
-                strategy_score = 1.0
-                
-                # 增加关注的关系类型的权重
-                if relation_type in focus_relations:
-                    strategy_score += 0.5
-                
-                # 检查实体类型
-                entity_type = self._get_entity_type(neighbor_id)
-                if entity_type in focus_entity_types:
-                    strategy_score += 0.3
-                
-                # 降低需要避免的关系类型的权重
-                if relation_type in avoid_relations:
-                    strategy_score -= 0.5
-                
-                # 添加来自图的原始权重
-                graph_weight = float(neighbor.get('weight', 1.0))
-                
-                # 计算最终得分(语义相似度*策略分数*关系权重*图权重)
-                final_score = similarity * strategy_score * relation_weight * graph_weight
-                
-                # 添加到评分列表
-                scored_neighbors.append({
-                    "id": neighbor_id,
-                    "description": description,
-                    "relation_type": relation_type,
-                    "source": neighbor.get('source', ''),
-                    "target": neighbor.get('target', ''),
-                    "similarity": similarity,
-                    "strategy_score": strategy_score,
-                    "relation_weight": relation_weight,
-                    "graph_weight": graph_weight,
-                    "final_score": final_score
-                })
-            except Exception as e:
-                print(f"计算节点相似度失败: {e}")
-                
-        # 按最终得分排序
-        return sorted(scored_neighbors, key=lambda x: x['final_score'], reverse=True)
+        focus_relations = set(exploration_strategy.get("focus_relations", []))
+        focus_entity_types = set(exploration_strategy.get("focus_entity_types", []))
+        avoid_relations = set(exploration_strategy.get("avoid_relations", []))
+        
+        neighbor_ids = [n.get('id', '') for n in neighbors]
+        descriptions = [n.get('description', '') for n in neighbors]
+        relation_types = [n.get('relation_type', '') for n in neighbors]
+        
+        # 一次往返批量获取所有邻居的实体类型；策略未关注实体类型时无需查询
+        entity_types = self._get_entity_types(neighbor_ids) if focus_entity_types else {}
+        
+        try:
+            # 批量计算所有邻居描述与查询的语义相似度
+            similarities = self._batch_similarity(query_embedding, descriptions)
+        except Exception as e:
+            # 嵌入失败时相似度按中性值1处理，仍按策略、关系和图权重排序，不中断本步探索
+            logger.error("计算节点相似度失败，仅按权重排序: %s", e)
+            similarities = np.ones(len(neighbors), dtype=np.float32)
+        
+        # 各项得分按列存储，整体做向量运算
+        relation_weight_arr = np.array(
+            [relation_weights.get(t, 1.0) for t in relation_types], dtype=np.float32
+        )
+        
+        # 计算策略匹配分数: 关注的关系类型+0.5，关注的实体类型+0.3，需要避免的关系类型-0.5
+        strategy_scores = (
+            1.0
+            + 0.5 * np.array([t in focus_relations for t in relation_types], dtype=np.float32)
+            + 0.3 * np.array([entity_types.get(i, "unknown") in focus_entity_types
+                              for i in neighbor_ids], dtype=np.float32)
+            - 0.5 * np.array([t in avoid_relations for t in relation_types], dtype=np.float32)
+        ).astype(np.float32)
+        
+        # 来自图的原始权重
+        graph_weights = np.array([n.get('weight', 1.0) for n in neighbors], dtype=np.float32)
+        
+        # 计算最终得分(语义相似度*策略分数*关系权重*图权重)
+        final_scores = similarities * strategy_scores * relation_weight_arr * graph_weights
+        
+        # 按最终得分降序排序；只需前k个时先用argpartition在O(n)内选出再排序
+        if top_k is not None and top_k < len(final_scores):
+            top_indices = np.argpartition(-final_scores, top_k - 1)[:top_k]
+            order = top_indices[np.argsort(-final_scores[top_indices], kind="stable")]
+        else:
+            order = np.argsort(-final_scores, kind="stable")
+        
+        return [
+            {
+                "id": neighbor_ids[i],
+                "description": descriptions[i],
+                "relation_type": relation_types[i],
+                "source": neighbors[i].get('source', ''),
+                "target": neighbors[i].get('target', ''),
+                "similarity": float(similarities[i]),
+                "strategy_score": float(strategy_scores[i]),
+                "relation_weight": float(relation_weight_arr[i]),
+                "graph_weight": float(graph_weights[i]),
+                "final_score": float(final_scores[i])
+            }
+            for i in order
+        ]
+    
+    def _batch_similarity(self, query_embedding, texts):
+        """
+        批量计算文本与查询的余弦相似度，空文本记为0
+        
+        Args:
+            query_embedding: 查询嵌入向量
+            texts: 文本列表
+            
+        Returns:
+            np.ndarray: 与texts一一对应的相似度数组
+        """
+        similarities = np.zeros(len(texts), dtype=np.float32)
+        # 相同文本只嵌入一次
+        unique_texts = list(dict.fromkeys(t for t in texts if t))
+        if not unique_texts:
+            return similarities
+        
+        if hasattr(self.embeddings, 'embed_documents'):
+            text_embeddings = self.embeddings.embed_documents(unique_texts)
+        else:
+            text_embeddings = [self.embeddings.embed_query(t) for t in unique_texts]
+        
+        # 一次矩阵运算得到全部相似度，启发式打分用float32即可
+        scores = cosine_similarity(
+            np.asarray(query_embedding, dtype=np.float32).reshape(1, -1),
+            np.asarray(text_embeddings, dtype=np.float32)
+        )[0]
+        score_map = dict(zip(unique_texts, scores))
+        
+        for i, text in enumerate(texts):
+            if text:
+                similarities[i] = score_map[text]
+        return similarities
     
     def _get_entity_type(self, entity_id):
         """
@@ -429,28 +500,65 @@ class ChainOfExplorationSearcher:
         Returns:
             str: 实体类型
         """
+        return self._get_entity_types([entity_id]).get(entity_id, "unknown")
+    
+    def _get_entity_types(self, entity_ids):
+        """
+        批量获取实体类型，用UNWIND在一次查询中完成
+        
+        Args:
+            entity_ids: 实体ID列表
+            
+        Returns:
+            Dict[str, str]: 实体ID到实体类型的映射
+        """
+        entity_ids = list(dict.fromkeys(e for e in entity_ids if e))
+        
+        # 先从缓存中取
+        entity_types = {}
+        missing_ids = []
+        for entity_id in entity_ids:
+            if entity_id in self._entity_type_cache:
+                self._entity_type_cache.move_to_end(entity_id)
+                entity_types[entity_id] = self._entity_type_cache[entity_id]
+            else:
+                missing_ids.append(entity_id)
+        
+        if not missing_ids:
+            return entity_types
+            
         try:
             query = """
-            MATCH (e:__Entity__ {id: $entity_id})
-            RETURN labels(e) AS types
+            UNWIND $entity_ids AS entity_id
+            MATCH (e:__Entity__ {id: entity_id})
+            RETURN entity_id AS id, labels(e) AS types
             """
             
-            result = self.graph.query(query, params={"entity_id": entity_id})
+            result = self.graph.query(query, params={"entity_ids": missing_ids})
             
             if not result or (hasattr(result, 'empty') and result.empty):
-                return "unknown"
+                return entity_types
                 
             if isinstance(result, pd.DataFrame):
-                types = result.iloc[0]['types']
-                # 过滤掉 "__Entity__" 标签
-                entity_types = [t for t in types if t != "__Entity__"]
-                return entity_types[0] if entity_types else "unknown"
+                rows = result.to_dict('records')
             else:
-                # 处理其他结果格式
-                return "unknown"
+                rows = result
+            
+            for row in rows:
+                # 过滤掉 "__Entity__" 标签
+                types = [t for t in (row.get('types') or []) if t != "__Entity__"]
+                entity_type = types[0] if types else "unknown"
+                entity_types[row['id']] = entity_type
+                self._entity_type_cache[row['id']] = entity_type
+            
+            # 超出容量时淘汰最久未使用的条目
+            while len(self._entity_type_cache) > self.max_cached_types:
+                self._entity_type_cache.popitem(last=False)
+            
+            return entity_types
         except Exception as e:
-            print(f"获取实体类型失败: {e}")
-            return "unknown"
+            logger.error("获取实体类型失败: %s", e)
+            return entity_types
     
     def _decide_next_step_with_memory(self, query, current_entities, scored_neighbors, width, current_step):
         """
@@ -466,7 +574,8 @@ class ChainOfExplorationSearcher:
         Returns:
             Tuple[List[str], str]: 下一步实体列表和推理过程
         """
-        memory_key = f"{query}_{','.join(sorted(current_entities))}"
+        # 以(查询, 实体集合)为键，无需排序拼接字符串，也不会因ID中含分隔符而冲突
+        memory_key = (query, frozenset(current_entities))
         
         # 检查是否有记忆
         if memory_key in self.exploration_memory:
@@ -489,10 +598,14 @@ class ChainOfExplorationSearcher:
         
         # 添加前10个最相关的选项(或全部如果少于10个)
         top_options = scored_neighbors[:10] if len(scored_neighbors) > 10 else scored_neighbors
-        for i, neighbor in enumerate(top_options):
-            prompt += f"{i+1}. {neighbor['id']} (得分: {neighbor['final_score']:.2f})\n"
-            prompt += f"   - 描述: {neighbor['description']}\n"
-            prompt += f"   - 关系类型: {neighbor['relation_type']} (连接到: {neighbor['source'] if neighbor['target'] in current_entities else neighbor['target']})\n\n"
+        # 集合查找，避免每个选项都线性扫描当前实体列表
+        current_entity_set = set(current_entities)
+        prompt += "".join(
+            f"{i+1}. {neighbor['id']} (得分: {neighbor['final_score']:.2f})\n"
+            f"   - 描述: {neighbor['description']}\n"
+            f"   - 关系类型: {neighbor['relation_type']} (连接到: {neighbor['source'] if neighbor['target'] in current_entity_set else neighbor['target']})\n\n"
+            for i, neighbor in enumerate(top_options)
+        )
             
         prompt += f"""
         请选择最多{width}个最有价值的实体继续探索。你的选择应该:
@@ -514,8 +627,8 @@ class ChainOfExplorationSearcher:
             content = response.content if hasattr(response, 'content') else str(response)
             
             # 解析结果
-            entities_match = re.search(r'实体:\s*\[(.*?)\]', content, re.DOTALL)
-            reasoning_match = re.search(r'推理:(.*?)($|```)', content, re.DOTALL)
+            entities_match = _DECISION_ENTITIES_RE.search(content)
+            reasoning_match = _DECISION_REASONING_RE.search(content)
             
             selected_entities = []
             reasoning = "无具体推理过程"
@@ -542,50 +655,70 @@ class ChainOfExplorationSearcher:
                 "reasoning": reasoning,
                 "step": current_step
             }
+            self.exploration_memory.move_to_end(memory_key)
+            while len(self.exploration_memory) > self.max_memory_entries:
+                self.exploration_memory.popitem(last=False)
             
             return selected_entities, reasoning
                 
         except Exception as e:
-            print(f"LLM决策失败: {e}")
+            logger.error("LLM决策失败: %s", e)
             # 出错时使用简单启发式方法
             fallback_entities = [n['id'] for n in scored_neighbors[:width]]
             fallback_reasoning = "决策过程出错，默认选择得分最高的实体"
             return fallback_entities, fallback_reasoning
     
-    def _get_entity_info(self, entities):
+    def _get_entity_and_community_info(self, entities):
         """
-        获取实体详细信息
+        获取实体详细信息及其所属社区，用OPTIONAL MATCH合并为一次查询
         
         Args:
             entities: 实体ID列表
             
         Returns:
-            List: 实体信息列表
+            Tuple[List, List]: 实体信息列表和社区信息列表
         """
         if not entities:
-            return []
+            return [], []
             
         try:
             query = """
             MATCH (e:__Entity__)
             WHERE e.id IN $entity_ids
+            OPTIONAL MATCH (e)-[:IN_COMMUNITY]->(c:__Community__)
             RETURN e.id AS id, e.description AS description,
-                   labels(e) AS types
+                   labels(e) AS types,
+                   collect(DISTINCT CASE WHEN c IS NOT NULL
+                       THEN {community_id: c.id, summary: c.summary} END) AS communities
             """
             
             result = self.graph.query(query, params={"entity_ids": entities})
             
             if not result or (hasattr(result, 'empty') and result.empty):
-                return []
+                return [], []
                 
             # 转换结果
             if isinstance(result, pd.DataFrame):
-                return result.to_dict('records')
-            return result
+                rows = result.to_dict('records')
+            else:
+                rows = result
+            
+            entity_info = []
+            community_info = []
+            seen_communities = set()
+            for row in rows:
+                communities = row.pop('communities', None) or []
+                entity_info.append(row)
+                for community in communities:
+                    if community and community['community_id'] not in seen_communities:
+                        seen_communities.add(community['community_id'])
+                        community_info.append(community)
+            
+            return entity_info, community_info
             
         except Exception as e:
-            print(f"获取实体信息失败: {e}")
-            return []
+            logger.error("获取实体信息失败: %s", e)
+            return [], []
     
     def _get_relationship_info(self, entities):
         """
@@ -604,6 +737,7 @@ class ChainOfExplorationSearcher:
             query = """
             MATCH (e1:__Entity__)-[r]-(e2:__Entity__)
             WHERE e1.id IN $entity_ids AND e2.id IN $visited_ids
+              AND (NOT e2.id IN $entity_ids OR e1.id <= e2.id)
             RETURN startNode(r).id AS source, endNode(r).id AS target,
                    type(r) AS type, r.description AS description,
                    CASE WHEN r.weight IS NOT NULL THEN r.weight ELSE 1.0 END AS weight
@@ -626,7 +760,7 @@ class ChainOfExplorationSearcher:
             return result
             
         except Exception as e:
-            print(f"获取关系信息失败: {e}")
+            logger.error("获取关系信息失败: %s", e)
             return []
     
     def _get_content_info(self, entities):
@@ -661,41 +795,7 @@ class ChainOfExplorationSearcher:
             return result
             
         except Exception as e:
-            print(f"获取内容信息失败: {e}")
-            return []
-    
-    def _get_community_info(self, entities):
-        """
-        获取实体所属社区信息
-        
-        Args:
-            entities: 实体ID列表
-            
-        Returns:
-            List: 社区信息列表
-        """
-        if not entities:
-            return []
-            
-        try:
-            query = """
-            MATCH (e:__Entity__)-[:IN_COMMUNITY]->(c:__Community__)
-            WHERE e.id IN $entity_ids
-            RETURN DISTINCT c.id AS community_id, c.summary AS summary
-            """
-            
-            result = self.graph.query(query, params={"entity_ids": entities})
-            
-            if not result or (hasattr(result, 'empty') and result.empty):
-                return []
-                
-            # 转换结果
-            if isinstance(result, pd.DataFrame):
-                return result.to_dict('records')
-            return result
-            
-        except Exception as e:
-            print(f"获取社区信息失败: {e}")
+            logger.error("获取内容信息失败: %s", e)
             return []
     
     def _rank_content_by_relevance(self, query_embedding, content_list):
@@ -712,35 +812,27 @@ class ChainOfExplorationSearcher:
         if not content_list:
             return []
             
-        scored_content = []
+        # 没有文本的内容不参与排序
+        content_list = [c for c in content_list if c.get("text", "")]
         
-        for content in content_list:
-            text = content.get("text", "")
-            
-            if not text:
-                continue
-                
-            try:
-                # 计算文本嵌入
-                text_embedding = self.embeddings.embed_query(text)
-                
-                # 计算相似度
-                similarity = cosine_similarity(
-                    np.array(query_embedding).reshape(1, -1),
-                    np.array(text_embedding).reshape(1, -1)
-                )[0][0]
-                
-                # 添加相似度分数
-                scored_item = content.copy()
-                scored_item["relevance_score"] = similarity
-                scored_content.append(scored_item)
-                
-            except Exception as e:
-                print(f"计算内容相似度失败: {e}")
-                scored_content.append(content)
+        # 整批计算相似度，异常只在外层处理一次
+        try:
+            similarities = self._batch_similarity(
+                query_embedding, [c["text"] for c in content_list]
+            )
+        except Exception as e:
+            logger.error("计算内容相似度失败: %s", e)
+            return content_list
+        
+        # 添加相似度分数
+        scored_content = []
+        for content, similarity in zip(content_list, similarities):
+            scored_item = content.copy()
+            scored_item["relevance_score"] = float(similarity)
+            scored_content.append(scored_item)
         
         # 按相关性排序
-        return sorted(scored_content, key=lambda x: x.get("relevance_score", 0), reverse=True)
+        return sorted(scored_content, key=lambda x: x["relevance_score"], reverse=True)
 
     async def explore_async(self, query: str, starting_entities: List[str], max_steps: int = 5):
         """
@@ -1,10 +1,24 @@
 from typing import List, Dict, Any
 import time
+import heapq
 import numpy as np
 import jieba.analyse
 import re
 from sklearn.metrics.pairwise import cosine_similarity
 
+# 从LLM回复中提取查询、句子和"键: 值"行
+_QUOTED_RE = re.compile(r'"([^"]+)"')
+_SENTENCE_RE = re.compile(r'[？?!！。；;][^？?!！。；;]{5,50}[？?!！。；;]')
+_KEY_VALUE_LINE_RE = re.compile(r'^[^:：\n]*[:：](.*)$', re.MULTILINE)
+# 时序信息：按从长到短的顺序合并为一个模式
+_TEMPORAL_RE = re.compile(
+    r'\d{4}年\d{1,2}月\d{1,2}日'
+    r'|\d{4}-\d{1,2}-\d{1,2}'
+    r'|\d{4}年\d{1,2}月'
+    r'|\d{4}-\d{1,2}'
+    r'|\d{4}年'
+)
+
 class CommunityAwareSearchEnhancer:
     """
     社区感知搜索增强器
@@ -42,7 +56,7 @@ class CommunityAwareSearchEnhancer:
         if cache_key in self.cache:
             return self.cache[cache_key]
         
-        search_start = time.time()
+        search_start = time.monotonic()
         
         # 步骤1: 找到相关社区
         relevant_communities = self.find_relevant_communities(query, keywords)
@@ -57,7 +71,7 @@ class CommunityAwareSearchEnhancer:
         enhanced_context = {
             "community_info": community_knowledge,
             "search_strategy": self.generate_search_strategy(query, community_knowledge),
-            "search_time": time.time() - search_start
+            "search_time": time.monotonic() - search_start
         }
         
         # 缓存结果
@@ -98,6 +112,10 @@ class CommunityAwareSearchEnhancer:
             if not communities:
                 return []
                 
+            # 关键词只转换一次小写，所有社区共用
+            high_level_kw = [kw.lower() for kw in keywords.get('high_level', [])]
+            low_level_kw = [kw.lower() for kw in keywords.get('low_level', [])]
+            
             # 计算社区与查询的相关性
             scored_communities = []
             for comm in communities:
@@ -113,13 +131,9 @@ class CommunityAwareSearchEnhancer:
                     )[0][0]
                     
                     # 关键词匹配得分
-                    high_level_kw = keywords.get('high_level', [])
-                    low_level_kw = keywords.get('low_level', [])
-                    
-                    kw_score = sum(1 for kw in high_level_kw 
-                                   if kw.lower() in comm['summary'].lower()) * 2.0
-                    kw_score += sum(0.5 for kw in low_level_kw 
-                                    if kw.lower() in comm['summary'].lower())
+                    summary_lower = comm['summary'].lower()
+                    kw_score = sum(1 for kw in high_level_kw if kw in summary_lower) * 2.0
+                    kw_score += sum(0.5 for kw in low_level_kw if kw in summary_lower)
                     
                     # 社区重要性（如果有）
                     importance = comm.get('rank', 1) or 1
@@ -146,10 +160,8 @@ class CommunityAwareSearchEnhancer:
                     print(f"计算社区相似度时出错: {e}")
                     continue
             
-            # 排序并返回top_k个社区
-            return sorted(scored_communities, 
-                        key=lambda x: x['score'], 
-                        reverse=True)[:top_k]
+            # 只选出top_k个得分最高的社区
+            return heapq.nlargest(top_k, scored_communities, key=lambda x: x['score'])
         
         except Exception as e:
             print(f"查询社区信息时出错: {e}")
@@ -235,21 +247,8 @@ class CommunityAwareSearchEnhancer:
 
     def _extract_temporal_info(self, text):
         """提取文本中的时序信息"""
-        # 简单的正则表达式匹配时序信息
-        import re
-        time_patterns = [
-            r'\d{4}年\d{1,2}月\d{1,2}日',
-            r'\d{4}-\d{1,2}-\d{1,2}',
-            r'\d{4}年\d{1,2}月',
-            r'\d{4}-\d{1,2}',
-            r'\d{4}年'
-        ]
-        
-        matches = []
-        for pattern in time_patterns:
-            matches.extend(re.findall(pattern, text))
-        
-        return matches
+        # 一次扫描匹配所有时间格式，同一位置取最完整的日期
+        return _TEMPORAL_RE.findall(text)
     
     def generate_search_strategy(self, query: str, 
                                community_knowledge: Dict) -> Dict:
@@ -296,22 +295,19 @@ class CommunityAwareSearchEnhancer:
             keywords = jieba.analyse.extract_tags(content, topK=10)
             
             # 从原始内容中提取可能的查询
-            query_pattern = r'"([^"]+)"'
-            queries = re.findall(query_pattern, content)
+            queries = _QUOTED_RE.findall(content)
             
             # 如果没有找到引号引起的查询，尝试提取句子
             if not queries:
-                sentence_pattern = r'[？?!！。；;][^？?!！。；;]{5,50}[？?!！。；;]'
-                sentences = re.findall(sentence_pattern, content)
+                sentences = _SENTENCE_RE.findall(content)
                 queries = [s.strip() for s in sentences if len(s.strip()) > 10][:3]
             
             # 提取可能的实体
-            entities = []
-            for line in content.split('\n'):
-                if ':' in line or '：' in line:
-                    parts = re.split(r'[：:]', line, 1)
-                    if len(parts) == 2 and len(parts[1].strip()) > 0:
-                        entities.append(parts[1].strip())
+            entities = [
+                value for value in
+                (m.group(1).strip() for m in _KEY_VALUE_LINE_RE.finditer(content))
+                if value
+            ]
             
             # 构建策略对象
             strategy = {
@@ -1,9 +1,26 @@
 from typing import Dict, List
+from collections import Counter, OrderedDict, deque
+import re
+import sys
 import time
 import hashlib
+import heapq
 
 from model.get_models import get_llm_model
 
+# 句子分隔符
+_SENTENCE_SPLIT_RE = re.compile(r'[.!?。！？]')
+# 带结尾标点的完整句子（最后一句可以没有标点）
+_SENTENCE_WITH_END_RE = re.compile(r'[^.!?。！？]*(?:[.!?。！？]\s*|\Z)')
+# 数值模式
+_NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)?(?:\s*%|\s*元|\s*美元|\s*人民币)?')
+_NUMBER_GROUP_RE = re.compile(r'(\d+(?:[.,]\d+)?(?:\s*%|\s*元|\s*美元|\s*人民币)?)')
+_NON_NUMERIC_RE = re.compile(r'[^\d.,]')
+# 名词短语模式（简化版）
+_NOUN_PHRASE_RE = re.compile(r'[A-Z][a-z]+\s+(?:[a-z]+\s+){0,2}[a-z]+')
+# 缺失字段的共享默认值，避免每次查找都新建空列表
+_EMPTY = ()
+
 class EvidenceChainTracker:
     """
     证据链收集和推理跟踪器
@@ -15,13 +32,16 @@ class EvidenceChainTracker:
     def __init__(self):
         """初始化证据链跟踪器"""
         self.llm = get_llm_model()
-        self.reasoning_steps = []  # 推理步骤
+        self.step_index = {}       # 推理步骤（步骤ID到步骤记录）
         self.evidence_items = {}   # 证据项
-        self.query_contexts = {}   # 查询上下文
+        self._evidence_refs = Counter()  # 每个证据被多少个推理步骤引用
+        self.query_contexts = OrderedDict()  # 查询上下文（按最近使用排序）
+        self.max_queries = 1000    # 最多保留的查询数，超出后淘汰最久未使用的查询
         self.step_counter = 0      # 步骤计数器
         self.confidence_scores = {}  # 证据的可信度评分
-        self.contradictions = {}     # 记录相互矛盾的证据
+        self.contradictions = deque(maxlen=1000)  # 记录相互矛盾的证据（仅保留最近的记录）
         self.citation_index = {}     # 引用索引
+        self._evidence_phrases = {}  # 证据ID到其在引用索引中的关键短语
         
     def start_new_query(self, query: str, keywords: Dict[str, List[str]]) -> str:
         """
@@ -37,15 +57,61 @@ class EvidenceChainTracker:
         # 生成查询ID
         query_id = hashlib.md5(f"{query}:{time.time()}".encode()).hexdigest()[:10]
         
-        # 存储查询上下文
-        self.query_contexts[query_id] = {
+        self._register_query(query_id, query, keywords)
+        return query_id
+    
+    def _register_query(self, query_id: str, query: str, keywords: Dict[str, List[str]]) -> Dict:
+        """
+        登记查询上下文，超出容量时先淘汰最久未使用的查询
+        
+        参数:
+            query_id: 查询ID
+            query: 用户查询
+            keywords: 查询关键词
+            
+        返回:
+            Dict: 新的查询上下文
+        """
+        while len(self.query_contexts) >= self.max_queries:
+            self._evict_oldest_query()
+        
+        context = {
             "query": query,
             "keywords": keywords,
             "start_time": time.time(),
             "step_ids": []
         }
+        self.query_contexts[query_id] = context
+        return context
+    
+    def _evict_oldest_query(self):
+        """淘汰最久未使用的查询及其推理步骤，不再被任何步骤引用的证据一并清理"""
+        _, context = self.query_contexts.popitem(last=False)
+        for step_id in context["step_ids"]:
+            step = self.step_index.pop(step_id, None)
+            if step is None:
+                continue
+            for evidence_id in step["evidence_ids"]:
+                self._evidence_refs[evidence_id] -= 1
+                if self._evidence_refs[evidence_id] <= 0:
+                    del self._evidence_refs[evidence_id]
+                    self._remove_evidence(evidence_id)
+    
+    def _remove_evidence(self, evidence_id: str):
+        """
+        删除证据及其可信度评分和引用索引
         
-        return query_id
+        参数:
+            evidence_id: 证据ID
+        """
+        self.evidence_items.pop(evidence_id, None)
+        self.confidence_scores.pop(evidence_id, None)
+        for phrase in self._evidence_phrases.pop(evidence_id, _EMPTY):
+            evidence_ids = self.citation_index.get(phrase)
+            if evidence_ids and evidence_id in evidence_ids:
+                evidence_ids.remove(evidence_id)
+                if not evidence_ids:
+                    del self.citation_index[phrase]
     
     def add_reasoning_step(self, 
                          query_id: str, 
@@ -76,10 +142,15 @@ class EvidenceChainTracker:
             "timestamp": time.time()
         }
         
-        # 添加步骤到列表并关联到查询
-        self.reasoning_steps.append(step)
-        if query_id in self.query_contexts:
-            self.query_contexts[query_id]["step_ids"].append(step_id)
+        # 未登记（或已被淘汰）的查询不跟踪其步骤，
+        # 所有保存的步骤都归属于某个查询，淘汰查询时能一并清理
+        context = self.query_contexts.get(query_id)
+        if context is None:
+            return step_id
+        
+        # 保存步骤并关联到查询
+        self.step_index[step_id] = step
+        context["step_ids"].append(step_id)
         
         return step_id
     
@@ -100,8 +171,14 @@ class EvidenceChainTracker:
         返回:
             str: 证据ID
         """
-        # 生成证据ID
-        evidence_id = hashlib.md5(f"{source_id}:{content[:50]}".encode()).hexdigest()[:10]
+        # 生成证据ID（分段写入哈希，避免拼接中间字符串；结果与拼接后整体哈希一致）
+        hasher = hashlib.md5(str(source_id).encode())
+        hasher.update(b":")
+        hasher.update(content[:50].encode())
+        evidence_id = hasher.hexdigest()[:10]
+        
+        # 来源类型只有少量固定取值，驻留后所有证据共享同一字符串对象
+        source_type = sys.intern(source_type)
         
         # 创建证据记录
         evidence = {
@@ -112,15 +189,16 @@ class EvidenceChainTracker:
             "timestamp": time.time()
         }
         
+        # 只保存属于已跟踪步骤的证据，证据随引用它的步骤一起淘汰
+        step = self.step_index.get(step_id)
+        if step is None:
+            return evidence_id
+        
         # 存储证据并关联到步骤
         self.evidence_items[evidence_id] = evidence
-        
-        # 查找步骤并添加证据ID
-        for step in self.reasoning_steps:
-            if step["step_id"] == step_id:
-                if evidence_id not in step["evidence_ids"]:
-                    step["evidence_ids"].append(evidence_id)
-                break
+        if evidence_id not in step["evidence_ids"]:
+            step["evidence_ids"].append(evidence_id)
+            self._evidence_refs[evidence_id] += 1
         
         return evidence_id
 
@@ -149,14 +227,16 @@ class EvidenceChainTracker:
         """
         # 添加基础证据
         evidence_id = self.add_evidence(step_id, source_id, content, source_type)
+        if evidence_id not in self.evidence_items:
+            # 步骤未被跟踪，证据没有保存
+            return evidence_id
         
         # 保存可信度评分
         self.confidence_scores[evidence_id] = confidence
         
         # 添加元数据（如果有）
         if metadata:
-            if evidence_id in self.evidence_items:
-                self.evidence_items[evidence_id]["metadata"] = metadata
+            self.evidence_items[evidence_id]["metadata"] = metadata
         
         # 更新引用索引
         self._update_citation_index(evidence_id, content)
@@ -173,6 +253,8 @@ class EvidenceChainTracker:
         """
         # 分析内容，提取关键短语
         key_phrases = self._extract_key_phrases(content)
+        # 记录证据对应的短语，删除证据时据此清理引用索引
+        self._evidence_phrases.setdefault(evidence_id, set()).update(key_phrases)
         
         # 将关键短语添加到引用索引
         for phrase in key_phrases:
@@ -194,26 +276,17 @@ class EvidenceChainTracker:
         """
         # 使用简单的启发式方法提取关键短语
         # 1. 划分为句子
-        import re
-        sentences = re.split(r'[.!?。！？]', content)
+        sentences = _SENTENCE_SPLIT_RE.split(content)
         
-        # 2. 从每个句子中提取名词短语和数值
-        key_phrases = []
-        
-        # 数值模式
-        number_pattern = r'\d+(?:[.,]\d+)?(?:\s*%|\s*元|\s*美元|\s*人民币)?'
-        
-        # 名词短语模式（简化版）
-        noun_phrase_pattern = r'[A-Z][a-z]+\s+(?:[a-z]+\s+){0,2}[a-z]+'
+        # 2. 从每个句子中提取名词短语和数值，用集合边收集边去重
+        key_phrases = set()
         
         for sentence in sentences:
             # 提取数值
-            numbers = re.findall(number_pattern, sentence)
-            key_phrases.extend(numbers)
+            key_phrases.update(_NUMBER_RE.findall(sentence))
             
             # 提取英文名词短语
-            noun_phrases = re.findall(noun_phrase_pattern, sentence)
-            key_phrases.extend(noun_phrases)
+            key_phrases.update(_NOUN_PHRASE_RE.findall(sentence))
             
             # 提取中文名词短语（简化）
             if len(sentence) > 3:
@@ -221,10 +294,10 @@ class EvidenceChainTracker:
                 for i in range(len(sentence) - 3):
                     phrase = sentence[i:i+4]
                     if len(phrase.strip()) >= 2:
-                        key_phrases.append(phrase.strip())
+                        key_phrases.add(phrase.strip())
         
-        # 去重并保留最有意义的短语
-        return list(set([p for p in key_phrases if len(p) > 1]))
+        # 保留最有意义的短语
+        return [p for p in key_phrases if len(p) > 1]
     
     def detect_contradictions(self, evidence_ids):
         """
@@ -243,22 +316,22 @@ class EvidenceChainTracker:
         evidences = [self.evidence_items[eid] for eid in evidence_ids if eid in self.evidence_items]
         
         # 1. 检测数值类矛盾（通过正则表达式）
-        import re
+        # 每个证据的数值及其上下文词集合只提取一次，而不是每对证据重复提取
+        numbers_by_evidence = [
+            [
+                (num_info, set(num_info["context"].lower().split()))
+                for num_info in self._extract_numbers_with_context(evidence["content"])
+            ]
+            for evidence in evidences
+        ]
+        
         for i in range(len(evidences)):
             for j in range(i+1, len(evidences)):
-                # 提取第一个证据中的数值
-                content1 = evidences[i]["content"]
-                numbers1 = self._extract_numbers_with_context(content1)
-                
-                # 提取第二个证据中的数值
-                content2 = evidences[j]["content"]
-                numbers2 = self._extract_numbers_with_context(content2)
-                
                 # 比较数值
-                for num1_info in numbers1:
-                    for num2_info in numbers2:
+                for num1_info, words1 in numbers_by_evidence[i]:
+                    for num2_info, words2 in numbers_by_evidence[j]:
                         # 检查上下文是否相似
-                        if self._context_similarity(num1_info["context"], num2_info["context"]) > 0.7:
+                        if self._word_set_similarity(words1, words2) > 0.7:
                             # 检查数值是否不同
                             if abs(num1_info["value"] - num2_info["value"]) > 0.001 * max(num1_info["value"], num2_info["value"]):
                                 contradictions.append({
@@ -272,10 +345,12 @@ class EvidenceChainTracker:
         
         # 2. 使用LLM检测语义矛盾
         if hasattr(self, 'llm') and self.llm:
+            # 已发现数值矛盾的证据对，集合查找代替逐条扫描
+            numerical_pairs = {(c["evidence1"], c["evidence2"]) for c in contradictions}
             for i in range(len(evidences)):
                 for j in range(i+1, len(evidences)):
                     # 检查是否已经发现数值矛盾
-                    if any(c["evidence1"] == evidence_ids[i] and c["evidence2"] == evidence_ids[j] for c in contradictions):
+                    if (evidence_ids[i], evidence_ids[j]) in numerical_pairs:
                         continue
                     
                     # 提取内容
@@ -288,9 +363,7 @@ class EvidenceChainTracker:
                         contradictions.append(contradiction)
         
         # 保存矛盾信息
-        for contradiction in contradictions:
-            contradiction_id = f"contradiction_{len(self.contradictions)}"
-            self.contradictions[contradiction_id] = contradiction
+        self.contradictions.extend(contradictions)
             
         return contradictions
     
@@ -304,13 +377,8 @@ class EvidenceChainTracker:
         返回:
             list: 包含数值和上下文的对象列表
         """
-        import re
-        
-        # 数值模式
-        number_pattern = r'(\d+(?:[.,]\d+)?(?:\s*%|\s*元|\s*美元|\s*人民币)?)'
-        
-        # 查找所有匹配
-        matches = list(re.finditer(number_pattern, text))
+        # 查找所有数值匹配
+        matches = list(_NUMBER_GROUP_RE.finditer(text))
         results = []
         
         for match in matches:
@@ -318,7 +386,7 @@ class EvidenceChainTracker:
             value_str = match.group(1)
             
             # 清理并转换为浮点数
-            clean_value = re.sub(r'[^\d.,]', '', value_str).replace(',', '.')
+            clean_value = _NON_NUMERIC_RE.sub('', value_str).replace(',', '.')
             try:
                 value = float(clean_value)
             except:
@@ -349,17 +417,29 @@ class EvidenceChainTracker:
             float: 相似度得分(0-1)
         """
         # 实现简单的基于单词重叠的相似度计算
-        words1 = set(context1.lower().split())
-        words2 = set(context2.lower().split())
+        return self._word_set_similarity(
+            set(context1.lower().split()),
+            set(context2.lower().split())
+        )
+    
+    @staticmethod
+    def _word_set_similarity(words1, words2):
+        """
+        计算两个单词集合的Jaccard相似度
         
+        参数:
+            words1: 第一个单词集合
+            words2: 第二个单词集合
+            
+        返回:
+            float: 相似度得分(0-1)
+        """
         if not words1 or not words2:
             return 0
-            
-        # 计算Jaccard相似度
-        intersection = len(words1.intersection(words2))
-        union = len(words1.union(words2))
         
-        return intersection / union if union > 0 else 0
+        # |A∪B| = |A| + |B| - |A∩B|，无需构建并集
+        intersection = len(words1 & words2)
+        return intersection / (len(words1) + len(words2) - intersection)
     
     def _detect_semantic_contradiction(self, content1, content2, evidence_id1, evidence_id2):
         """
@@ -451,24 +531,11 @@ class EvidenceChainTracker:
         返回:
             list: 关键语句列表
         """
-        import re
-        
-        # 按句子划分
-        sentences = re.split(r'([.!?。！？]\s*)', text)
-        
-        # 合并分隔符和句子
-        merged_sentences = []
-        i = 0
-        while i < len(sentences):
-            if i + 1 < len(sentences):
-                merged_sentences.append(sentences[i] + sentences[i+1])
-                i += 2
-            else:
-                merged_sentences.append(sentences[i])
-                i += 1
+        # 一次扫描划分出带结尾标点的句子
+        sentences = _SENTENCE_WITH_END_RE.findall(text)
         
         # 筛选出有意义的句子（长度大于10个字符）
-        key_statements = [s.strip() for s in merged_sentences if len(s.strip()) > 10]
+        key_statements = [s.strip() for s in sentences if len(s.strip()) > 10]
         
         return key_statements
     
@@ -485,24 +552,21 @@ class EvidenceChainTracker:
         # 提取语句中的关键短语
         key_phrases = self._extract_key_phrases(statement)
         
-        # 收集可能匹配的证据
-        candidate_evidence_ids = []
+        # 收集可能匹配的证据，同时统计每个证据命中的短语数
+        candidate_counts = Counter()
         for phrase in key_phrases:
             if phrase in self.citation_index:
-                candidate_evidence_ids.extend(self.citation_index[phrase])
+                candidate_counts.update(self.citation_index[phrase])
         
         # 如果没有候选证据，返回None
-        if not candidate_evidence_ids:
+        if not candidate_counts:
             return None
             
         # 计算每个证据的匹配得分
         evidence_scores = {}
-        for evidence_id in set(candidate_evidence_ids):
+        for evidence_id, base_score in candidate_counts.items():
             if evidence_id in self.evidence_items:
-                evidence = self.evidence_items[evidence_id]
-                # 基础得分 - 出现频率
-                base_score = candidate_evidence_ids.count(evidence_id)
-                # 可信度加权
+                # 基础得分为出现频率，按可信度加权
                 confidence = self.confidence_scores.get(evidence_id, 0.5)
                 # 最终得分
                 evidence_scores[evidence_id] = base_score * confidence
@@ -561,32 +625,39 @@ class EvidenceChainTracker:
         if query_id not in self.query_contexts:
             return {}
         
+        # 标记为最近使用
+        self.query_contexts.move_to_end(query_id)
+        
         # 获取查询相关的步骤ID
         step_ids = self.query_contexts[query_id]["step_ids"]
         
         # 按时间顺序收集步骤
         steps = []
         for step_id in step_ids:
-            for step in self.reasoning_steps:
-                if step["step_id"] == step_id:
-                    # 复制步骤并添加完整证据
-                    step_copy = step.copy()
-                    step_copy["evidence"] = []
-                    
-                    # 添加证据详情
-                    for evidence_id in step["evidence_ids"]:
-                        if evidence_id in self.evidence_items:
-                            evidence_copy = self.evidence_items[evidence_id].copy()
-                            # 添加可信度评分
-                            evidence_copy["confidence"] = self.confidence_scores.get(evidence_id, 0.5)
-                            step_copy["evidence"].append(evidence_copy)
-                    
-                    steps.append(step_copy)
-                    break
+            step = self.step_index.get(step_id)
+            if step is None:
+                continue
+            
+            # 复制步骤并添加完整证据
+            step_copy = step.copy()
+            step_copy["evidence"] = []
+            
+            # 添加证据详情
+            for evidence_id in step["evidence_ids"]:
+                if evidence_id in self.evidence_items:
+                    evidence_copy = self.evidence_items[evidence_id].copy()
+                    # 添加可信度评分
+                    evidence_copy["confidence"] = self.confidence_scores.get(evidence_id, 0.5)
+                    step_copy["evidence"].append(evidence_copy)
+            
+            steps.append(step_copy)
         
         # 按时间戳排序
         steps.sort(key=lambda x: x["timestamp"])
         
+        # 推理链涉及的全部证据ID
+        chain_evidence_ids = {e for s in steps for e in s["evidence_ids"]}
+        
         # 构建完整推理链
         reasoning_chain = {
             "query": self.query_contexts[query_id]["query"],
@@ -594,11 +665,10 @@ class EvidenceChainTracker:
             "start_time": self.query_contexts[query_id]["start_time"],
             "end_time": time.time(),
             "steps": steps,
-            "contradiction_count": len([c for c in self.contradictions.values() 
-                                     if any(c.get("evidence1", "") == e_id or c.get("evidence2", "") == e_id 
-                                         for e_id in 
-                                         [e for s in steps for e in s["evidence_ids"]])
-                                    ])
+            "contradiction_count": sum(
+                1 for c in self.contradictions
+                if c.get("evidence1", "") in chain_evidence_ids or c.get("evidence2", "") in chain_evidence_ids
+            )
         }
         
         return reasoning_chain
@@ -614,18 +684,16 @@ class EvidenceChainTracker:
             List[Dict]: 证据列表
         """
         # 查找步骤
-        for step in self.reasoning_steps:
-            if step["step_id"] == step_id:
-                # 收集证据
-                evidence_list = []
-                for evidence_id in step["evidence_ids"]:
-                    if evidence_id in self.evidence_items:
-                        evidence_list.append(
-                            self.evidence_items[evidence_id]
-                        )
-                return evidence_list
-        
-        return []
+        step = self.step_index.get(step_id)
+        if step is None:
+            return []
+        
+        # 收集证据
+        return [
+            self.evidence_items[evidence_id]
+            for evidence_id in step["evidence_ids"]
+            if evidence_id in self.evidence_items
+        ]
     
     def summarize_reasoning(self, query_id: str) -> Dict:
         """
@@ -641,23 +709,18 @@ class EvidenceChainTracker:
         if not chain:
             return {"summary": "没有找到相关推理链"}
         
-        # 计算统计信息
-        steps_count = len(chain.get("steps", []))
-        evidence_count = sum(len(step.get("evidence", [])) 
-                           for step in chain.get("steps", []))
-        
-        # 识别关键步骤（有最多证据的步骤）
-        key_steps = []
-        if steps_count > 0:
-            # 按证据数量排序
-            sorted_steps = sorted(
-                chain.get("steps", []),
-                key=lambda x: len(x.get("evidence", [])),
-                reverse=True
-            )
-            
-            # 取前3个关键步骤
-            key_steps = sorted_steps[:min(3, len(sorted_steps))]
+        # 计算统计信息，每个步骤的证据数只统计一次
+        steps = chain.get("steps", _EMPTY)
+        steps_count = len(steps)
+        step_evidence_counts = [len(step.get("evidence", _EMPTY)) for step in steps]
+        evidence_count = sum(step_evidence_counts)
+        
+        # 识别关键步骤（有最多证据的步骤），取证据数量最多的前3个
+        key_step_indices = heapq.nlargest(
+            3,
+            range(steps_count),
+            key=step_evidence_counts.__getitem__
+        )
         
         # 计算处理时间
         duration = chain.get("end_time", time.time()) - chain.get("start_time", time.time())
@@ -671,11 +734,11 @@ class EvidenceChainTracker:
             "contradiction_count": chain.get("contradiction_count", 0),
             "key_steps": [
                 {
-                    "step_id": step.get("step_id"),
-                    "search_query": step.get("search_query"),
-                    "evidence_count": len(step.get("evidence", []))
+                    "step_id": steps[i].get("step_id"),
+                    "search_query": steps[i].get("search_query"),
+                    "evidence_count": step_evidence_counts[i]
                 }
-                for step in key_steps
+                for i in key_step_indices
             ]
         }
         
@@ -695,17 +758,11 @@ class EvidenceChainTracker:
         if not chain:
             return {"sources": {}}
         
-        # 收集所有证据
-        all_evidence = []
-        for step in chain.get("steps", []):
-            all_evidence.extend(step.get("evidence", []))
-        
-        # 按来源类型分组
-        sources = {}
-        for evidence in all_evidence:
-            source_type = evidence.get("source_type", "unknown")
-            if source_type not in sources:
-                sources[source_type] = 0
-            sources[source_type] += 1
+        # 按来源类型计数所有证据
+        sources = Counter(
+            evidence.get("source_type", "unknown")
+            for step in chain.get("steps", _EMPTY)
+            for evidence in step.get("evidence", _EMPTY)
+        )
         
-        return {"sources": sources}
\ No newline at end of file
+        return {"sources": dict(sources)}
\ No newline at end of file
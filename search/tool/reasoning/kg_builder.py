@@ -1,7 +1,13 @@
 import networkx as nx
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import re
 import time
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
+# 实体关系提取结果的解析模式
+_ENTITY_RE = re.compile(r'\("entity" : "(.+?)" : "(.+?)" : "(.+?)"\)')
+_RELATIONSHIP_RE = re.compile(r'\("relationship" : "(.+?)" : "(.+?)" : "(.+?)" : "(.+?)" : (.+?)\)')
 
 class DynamicKnowledgeGraphBuilder:
     """
@@ -47,7 +53,7 @@ class DynamicKnowledgeGraphBuilder:
         self.knowledge_graph = nx.DiGraph()
         self.seed_entities = set(entities)
         
-        start_time = time.time()
+        start_time = time.monotonic()
         
         # 添加种子实体
         for entity in entities:
@@ -61,14 +67,14 @@ class DynamicKnowledgeGraphBuilder:
         self._explore_graph(entities, current_depth=0, max_depth=depth)
         
         # 添加图谱构建元数据
-        self.knowledge_graph.graph['build_time'] = time.time() - start_time
+        self.knowledge_graph.graph['build_time'] = time.monotonic() - start_time
         self.knowledge_graph.graph['query'] = query
         self.knowledge_graph.graph['entity_count'] = self.knowledge_graph.number_of_nodes()
         self.knowledge_graph.graph['relation_count'] = self.knowledge_graph.number_of_edges()
         
         print(f"构建查询图谱完成，包含 {self.knowledge_graph.number_of_nodes()} 个实体和 "
               f"{self.knowledge_graph.number_of_edges()} 个关系，耗时 "
-              f"{time.time() - start_time:.2f}秒")
+              f"{time.monotonic() - start_time:.2f}秒")
               
         return self.knowledge_graph
     
@@ -107,31 +113,33 @@ class DynamicKnowledgeGraphBuilder:
             if not relationships:
                 return
                 
-            # 收集新发现的实体
-            new_entities = []
+            # 收集新发现的实体和新的边，最后批量写入图谱
+            new_nodes = {}
+            new_edges = {}
             
-            # 添加关系到图谱
             for rel in relationships:
                 source = rel['source']
                 target = rel['target']
-                relation = rel['relation']
                 
                 # 检查目标实体是否已在图谱中
-                if target not in self.knowledge_graph:
-                    self.knowledge_graph.add_node(
-                        target,
-                        type="entity",
-                        properties={"description": rel.get('target_description', '')}
-                    )
-                    new_entities.append(target)
+                if target not in self.knowledge_graph and target not in new_nodes:
+                    new_nodes[target] = {
+                        "type": "entity",
+                        "properties": {"description": rel.get('target_description', '')}
+                    }
                     
-                # 添加边
-                if not self.knowledge_graph.has_edge(source, target):
-                    self.knowledge_graph.add_edge(
-                        source, 
-                        target, 
-                        type=relation
-                    )
+                # 同一条边只保留首次出现的关系类型
+                edge = (source, target)
+                if edge not in new_edges and not self.knowledge_graph.has_edge(source, target):
+                    new_edges[edge] = rel['relation']
+            
+            # 批量添加节点和边
+            self.knowledge_graph.add_nodes_from(new_nodes.items())
+            self.knowledge_graph.add_edges_from(
+                (source, target, {"type": relation})
+                for (source, target), relation in new_edges.items()
+            )
+            new_entities = list(new_nodes)
             
             # 递归探索新发现的实体
             if new_entities:
@@ -219,42 +227,85 @@ class DynamicKnowledgeGraphBuilder:
         try:
             # 使用实体关系提取器分析文本
             extraction_result = self.extractor._process_single_chunk(chunk_text)
+        except Exception as e:
+            print(f"从文本块提取子图时出错: {e}")
+            return False
+        
+        return self._add_extraction_result(extraction_result, chunk_id)
+    
+    def extract_subgraphs_from_chunks(self, chunks: List[Tuple[str, str]], max_workers: int = 4) -> List[str]:
+        """
+        从多个文本块中并发提取知识子图
+        
+        Args:
+            chunks: (文本块内容, 文本块ID) 列表
+            max_workers: 并发调用提取器的线程数
             
-            if not extraction_result:
-                return False
-                
-            # 解析结果
-            entity_pattern = re.compile(r'\("entity" : "(.+?)" : "(.+?)" : "(.+?)"\)')
-            relationship_pattern = re.compile(r'\("relationship" : "(.+?)" : "(.+?)" : "(.+?)" : "(.+?)" : (.+?)\)')
+        Returns:
+            List[str]: 成功提取的文本块ID列表
+        """
+        if not self.extractor or not chunks:
+            return []
+        
+        # 各文本块的LLM提取互不依赖，并发执行
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            futures = [
+                executor.submit(self.extractor._process_single_chunk, chunk_text)
+                for chunk_text, _ in chunks
+            ]
+        
+        # 写入内存图谱在当前线程中依次完成
+        extracted_ids = []
+        for future, (_, chunk_id) in zip(futures, chunks):
+            try:
+                extraction_result = future.result()
+            except Exception as e:
+                print(f"从文本块提取子图时出错: {e}")
+                continue
+            if self._add_extraction_result(extraction_result, chunk_id):
+                extracted_ids.append(chunk_id)
+        
+        return extracted_ids
+    
+    def _add_extraction_result(self, extraction_result: str, chunk_id: str) -> bool:
+        """
+        解析提取器输出并将实体和关系加入图谱
+        
+        Args:
+            extraction_result: 实体关系提取器的输出文本
+            chunk_id: 文本块ID
             
-            # 提取实体
-            for match in entity_pattern.findall(extraction_result):
-                entity_id, entity_type, description = match
-                
-                # 添加到图谱
-                if entity_id not in self.knowledge_graph:
-                    self.knowledge_graph.add_node(
-                        entity_id,
-                        type=entity_type,
-                        properties={
-                            "description": description,
-                            "source": f"chunk:{chunk_id}"
-                        }
-                    )
+        Returns:
+            bool: 是否成功提取
+        """
+        if not extraction_result:
+            return False
+            
+        # 同一文本块的所有实体和关系共用同一个来源标记
+        source = f"chunk:{chunk_id}"
+        
+        try:
+            # 提取实体，由生成器直接批量写入图谱（已存在的实体保持不变）
+            self.knowledge_graph.add_nodes_from(
+                (entity_id, {
+                    "type": entity_type,
+                    "properties": {"description": description, "source": source}
+                })
+                for entity_id, entity_type, description in _ENTITY_RE.findall(extraction_result)
+                if entity_id not in self.knowledge_graph
+            )
             
             # 提取关系
-            for match in relationship_pattern.findall(extraction_result):
-                source_id, target_id, rel_type, description, weight = match
-                
+            for source_id, target_id, rel_type, description, weight in _RELATIONSHIP_RE.findall(extraction_result):
                 # 确保节点存在
-                for node_id in [source_id, target_id]:
+                for node_id in (source_id, target_id):
                     if node_id not in self.knowledge_graph:
                         self.knowledge_graph.add_node(
                             node_id,
                             type="unknown",
                             properties={
                                 "description": "从关系中提取的实体",
-                                "source": f"chunk:{chunk_id}"
+                                "source": source
                             }
                         )
                 
@@ -266,7 +317,7 @@ class DynamicKnowledgeGraphBuilder:
                     properties={
                         "description": description,
                         "weight": float(weight),
-                        "source": f"chunk:{chunk_id}"
+                        "source": source
                     }
                 )
             
@@ -293,12 +344,8 @@ class DynamicKnowledgeGraphBuilder:
             # 使用PageRank算法找出重要节点
             pagerank = nx.pagerank(self.knowledge_graph)
             
-            # 排序
-            top_entities = sorted(
-                pagerank.items(), 
-                key=lambda x: x[1], 
-                reverse=True
-            )[:limit]
+            # 只选出得分最高的limit个
+            top_entities = heapq.nlargest(limit, pagerank.items(), key=lambda x: x[1])
             
             # 格式化结果
             result = []
@@ -315,22 +362,11 @@ class DynamicKnowledgeGraphBuilder:
             
         except Exception as e:
             print(f"计算中心实体时出错: {e}")
-            # 使用度中心性作为备选方案
-            in_degree = dict(self.knowledge_graph.in_degree())
-            out_degree = dict(self.knowledge_graph.out_degree())
-            
-            # 合并入度和出度
-            total_degree = {
-                node: in_degree.get(node, 0) + out_degree.get(node, 0)
-                for node in set(in_degree) | set(out_degree)
-            }
+            # 使用度中心性作为备选方案（有向图的度即入度与出度之和）
+            total_degree = dict(self.knowledge_graph.degree())
             
-            # 排序
-            top_entities = sorted(
-                total_degree.items(), 
-                key=lambda x: x[1], 
-                reverse=True
-            )[:limit]
+            # 只选出度最高的limit个
+            top_entities = heapq.nlargest(limit, total_degree.items(), key=lambda x: x[1])
             
             # 格式化结果
             result = []
@@ -1,5 +1,22 @@
 import re
-from typing import List, Optional
+from functools import lru_cache
+from typing import Any, List, Optional
+
+# 简单的句子分割（可以使用NLP库进行改进）
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z])')
+
+def response_text(response: Any) -> str:
+    """
+    获取LLM响应的文本内容
+    
+    参数:
+        response: LLM响应（带content属性的消息对象或其他对象）
+        
+    返回:
+        str: 响应文本，没有content属性时返回其字符串形式
+    """
+    content = getattr(response, "content", None)
+    return str(response) if content is None else content
 
 def extract_between(text: str, start_marker: str, end_marker: str) -> List[str]:
     """
@@ -13,8 +30,23 @@ def extract_between(text: str, start_marker: str, end_marker: str) -> List[str]:
     返回:
         List[str]: 提取的内容字符串列表
     """
-    pattern = re.escape(start_marker) + r"(.*?)" + re.escape(end_marker)
-    return re.findall(pattern, text, flags=re.DOTALL)
+    return _between_pattern(start_marker, end_marker).findall(text)
+
+@lru_cache(maxsize=64)
+def _between_pattern(start_marker: str, end_marker: str) -> "re.Pattern":
+    """编译并缓存起止标记之间内容的匹配模式，标记在推理过程中基本固定"""
+    return re.compile(re.escape(start_marker) + r"(.*?)" + re.escape(end_marker), re.DOTALL)
+
+@lru_cache(maxsize=64)
+def _template_pattern(template: str, regex: bool) -> "re.Pattern":
+    """将模板转换为正则表达式并缓存编译结果"""
+    if regex:
+        # 直接使用模板作为正则表达式
+        return re.compile(template, re.DOTALL)
+    # 将模板转换为正则表达式（通过转义和替换占位符）
+    pattern = template.replace("{}", "(.*?)")
+    pattern = re.escape(pattern).replace("\\(\\*\\*\\?\\)", "(.*?)")
+    return re.compile(pattern, re.DOTALL)
 
 def extract_from_templates(text: str, templates: List[str], regex: bool = False) -> List[str]:
     """
@@ -31,16 +63,7 @@ def extract_from_templates(text: str, templates: List[str], regex: bool = False)
     results = []
     
     for template in templates:
-        if regex:
-            # 直接使用模板作为正则表达式
-            matches = re.findall(template, text, re.DOTALL)
-            results.extend(matches)
-        else:
-            # 将模板转换为正则表达式（通过转义和替换占位符）
-            pattern = template.replace("{}", "(.*?)")
-            pattern = re.escape(pattern).replace("\\(\\*\\*\\?\\)", "(.*?)")
-            matches = re.findall(pattern, text, re.DOTALL)
-            results.extend(matches)
+        results.extend(_template_pattern(template, regex).findall(text))
     
     return results
 
@@ -58,9 +81,7 @@ def extract_sentences(text: str, max_sentences: Optional[int] = None) -> List[st
     if not text:
         return []
     
-    # 简单的句子分割（可以使用NLP库进行改进）
-    sentence_endings = r'(?<=[.!?])\s+(?=[A-Z])'
-    sentences = re.split(sentence_endings, text)
+    sentences = _SENTENCE_END_RE.split(text)
     
     # 移除空字符串
     sentences = [s.strip() for s in sentences if s.strip()]
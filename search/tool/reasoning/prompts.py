@@ -2,6 +2,12 @@ from typing import List, Dict, Any
 from collections import defaultdict
 import logging
 
+# 模块加载时解析一次计数函数，避免每个文本块都执行导入语句
+try:
+    from model.get_models import count_tokens
+except ImportError:
+    count_tokens = None
+
 def num_tokens_from_string(text: str) -> int:
     """
     估算文本字符串中的token数量
@@ -12,12 +18,13 @@ def num_tokens_from_string(text: str) -> int:
     返回:
         int: 估计的token数
     """
-    try:
-        from model.get_models import count_tokens
-        return count_tokens(text)
-    except:
-        # 简单备用
-        return len(text) // 4
+    if count_tokens is not None:
+        try:
+            return count_tokens(text)
+        except Exception:
+            pass
+    # 简单备用
+    return len(text) // 4
 
 def kb_prompt(kbinfos: Dict[str, List[Dict[str, Any]]], max_tokens: int = 4096) -> List[str]:
     """
@@ -78,19 +85,18 @@ def kb_prompt(kbinfos: Dict[str, List[Dict[str, Any]]], max_tokens: int = 4096)
     # 格式化最终知识块
     formatted_knowledges = []
     for doc_name, cks_meta in doc2chunks.items():
-        txt = f"\nDocument: {doc_name} \n"
+        parts = [f"\nDocument: {doc_name} \n"]
         
         # 添加元数据
-        for k, v in cks_meta["meta"].items():
-            txt += f"{k}: {v}\n"
+        parts.extend(f"{k}: {v}\n" for k, v in cks_meta["meta"].items())
             
-        txt += "Relevant fragments as following:\n"
+        parts.append("Relevant fragments as following:\n")
         
         # 添加chunk内容
-        for chunk in cks_meta["chunks"]:
-            txt += f"{chunk}\n"
-            
-        formatted_knowledges.append(txt)
+        parts.extend(f"{chunk}\n" for chunk in cks_meta["chunks"])
+        
+        # 各片段最后一次性拼接，避免逐段 += 反复复制字符串
+        formatted_knowledges.append("".join(parts))
     
     # 如果没有找到chunks
     if not formatted_knowledges:
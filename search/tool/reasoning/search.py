@@ -1,12 +1,33 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import ast
+import logging
 import re
+import threading
+import time
+
+from search.tool.reasoning.nlp import response_text
+
+logger = logging.getLogger(__name__)
+
+# 匹配编号列表项（如 "1. xxx" 或 "2) xxx"），用于LLM未返回列表字面量时的兜底解析
+_LIST_RE = re.compile(r'^\s*\d+[.)]\s*(.+?)\s*$', re.MULTILINE)
+# LLM返回的列表字面量
+_LIST_LITERAL_RE = re.compile(r'\[.*\]', re.DOTALL)
+
+# LLM评估结果选项，忽略大小写匹配，无需复制整段响应做小写转换
+_PRECISE_RE = re.compile("precise", re.IGNORECASE)
+_KB_RE = re.compile("kb", re.IGNORECASE)
 
 class DualPathSearcher:
     """
     双路径搜索器：支持同时使用多种方式搜索知识库
     """
     
-    def __init__(self, kb_retriever, kg_retriever=None, kb_name=""):
+    def __init__(self, kb_retriever, kg_retriever=None, kb_name="", max_workers: int = 4,
+                 search_timeout: Optional[float] = None, cache_ttl: float = 300.0,
+                 cache_size: int = 512, log_func=None):
         """
         初始化双路径搜索器
         
@@ -14,10 +35,69 @@ class DualPathSearcher:
             kb_retriever: 知识库搜索函数
             kg_retriever: 知识图谱搜索函数
             kb_name: 知识库名称，用于构建查询
+            max_workers: 检索线程池的线程数
+            search_timeout: 单次搜索的超时秒数，超时的检索路径按空结果处理；None表示不限时
+            cache_ttl: 检索结果缓存的有效秒数，0表示不缓存
+            cache_size: 检索结果缓存的最大条目数
+            log_func: 可选的执行日志记录函数，命中缓存时用它补记检索，
+                因为缓存命中不会再执行检索函数内部的日志
         """
         self.kb_retriever = kb_retriever
         self.kg_retriever = kg_retriever
         self.kb_name = kb_name
+        self.search_timeout = search_timeout
+        self.log_func = log_func
+        # 常驻线程池，两路查询并发执行，避免每次搜索创建和销毁线程
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dual-search")
+        # 预取的两路检索：查询 -> (精确查询Future, 带知识库名查询Future)
+        # 调用方线程和流式生成回调都会读写，需加锁
+        self._prefetched = {}
+        self._prefetch_lock = threading.Lock()
+        self.max_prefetched = 32
+        # 检索结果缓存（LRU + TTL）：去除首尾空白的完整查询 -> (提交时间, 检索Future)
+        # 缓存Future而非结果，同一查询并发检索时也只执行一次
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._retrieval_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+    
+    def close(self):
+        """关闭搜索线程池"""
+        self.reset()
+        self._pool.shutdown(wait=False)
+    
+    def reset(self):
+        """清空预取结果和检索缓存，每次新的研究开始时调用，避免复用上一次研究的检索"""
+        with self._prefetch_lock:
+            prefetched = list(self._prefetched.values())
+            self._prefetched.clear()
+        for futures in prefetched:
+            for future in futures:
+                future.cancel()
+        
+        with self._cache_lock:
+            self._retrieval_cache.clear()
+    
+    def prefetch(self, query: str):
+        """
+        提前在后台提交两路检索，之后对同一查询调用search时直接复用检索结果
+        
+        只预取检索本身，结果选择（可能调用LLM）仍在search时执行，
+        未被实际使用的预取查询不会产生LLM调用
+        
+        参数:
+            query: 搜索查询
+        """
+        with self._prefetch_lock:
+            if query in self._prefetched:
+                return
+            
+            # 丢弃最早的未被使用的预取记录，防止无限增长
+            # （检索Future可能已被缓存共享，不取消）
+            while len(self._prefetched) >= self.max_prefetched:
+                del self._prefetched[next(iter(self._prefetched))]
+            
+            self._prefetched[query] = self._submit_queries(query)
     
     def search(self, query: str) -> Dict:
         """
@@ -29,15 +109,106 @@ class DualPathSearcher:
         返回:
             Dict: 搜索结果
         """
+        # 优先使用预取的检索，否则立即并发执行两种查询
+        with self._prefetch_lock:
+            prefetched = self._prefetched.pop(query, None)
+        if prefetched is not None and any(self._failed(future) for future in prefetched):
+            # 预取的检索已取消或失败，重新检索
+            prefetched = None
+        precise_future, kb_future = prefetched or self._submit_queries(query)
+        
+        deadline = self._deadline()
+        return self._select_results(
+            query,
+            self._result_before(precise_future, deadline),
+            self._result_before(kb_future, deadline)
+        )
+    
+    def _deadline(self) -> Optional[float]:
+        """计算本次搜索的截止时间"""
+        if self.search_timeout is None:
+            return None
+        return time.monotonic() + self.search_timeout
+    
+    def _result_before(self, future, deadline: Optional[float]) -> Dict:
+        """
+        在截止时间前获取单个检索结果，超时则取消该检索并返回空结果，
+        不影响其他已完成的检索路径
+        """
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            logger.warning("[双路径搜索] 检索超时，按空结果处理")
+        except CancelledError:
+            # 缓存共享的检索可能已被其他超时的搜索取消
+            logger.warning("[双路径搜索] 检索已取消，按空结果处理")
+        return {"chunks": [], "doc_aggs": []}
+    
+    @staticmethod
+    def _failed(future) -> bool:
+        """检索Future是否已被取消或以异常结束"""
+        return future.done() and (future.cancelled() or future.exception() is not None)
+    
+    def _submit_queries(self, query: str):
+        """提交精确查询和带知识库名查询两路检索，返回两个Future"""
+        precise_query, kb_query = self._build_queries(query)
+        return self._submit_retrieval(precise_query), self._submit_retrieval(kb_query)
+    
+    def _submit_retrieval(self, query: str):
+        """
+        提交一次知识库检索，命中缓存时直接复用已有的检索Future
+        
+        参数:
+            query: 检索查询
+            
+        返回:
+            Future: 检索结果的Future
+        """
+        if self.cache_ttl <= 0:
+            return self._pool.submit(self.kb_retriever, query)
+        
+        # 使用完整查询作为键，不截断也不忽略大小写，避免不同查询共用结果
+        key = query.strip()
+        now = time.monotonic()
+        with self._cache_lock:
+            cached = self._retrieval_cache.get(key)
+            if cached is not None:
+                submitted_at, future = cached
+                if now - submitted_at <= self.cache_ttl and not self._failed(future):
+                    self._retrieval_cache.move_to_end(key)
+                    if self.log_func is not None:
+                        self.log_func(f"\n[KB检索] 命中检索缓存: {query}")
+                    return future
+            
+            future = self._pool.submit(self.kb_retriever, query)
+            self._retrieval_cache[key] = (now, future)
+            self._retrieval_cache.move_to_end(key)
+            while len(self._retrieval_cache) > self.cache_size:
+                self._retrieval_cache.popitem(last=False)
+            return future
+    
+    def _build_queries(self, query: str):
+        """构建精确查询和带知识库名称的查询"""
         # 精确查询
         precise_query = query.replace(self.kb_name, "").strip()
         # 带名称的查询
         kb_query = f"{self.kb_name} {query}" if self.kb_name.lower() not in query.lower() else query
+        return precise_query, kb_query
+    
+    def _select_results(self, query: str, precise_results: Dict, kb_results: Dict) -> Dict:
+        """
+        在两路检索结果中选择更有价值的结果，或将其合并
         
-        # 执行两种查询
-        precise_results = self.kb_retriever(precise_query)
-        kb_results = self.kb_retriever(kb_query)
-        
+        参数:
+            query: 原始查询
+            precise_results: 精确查询结果
+            kb_results: 带知识库名查询结果
+            
+        返回:
+            Dict: 搜索结果
+        """
         # 提取文本内容以便LLM评估
         precise_text = self._extract_text_for_evaluation(precise_results)
         kb_text = self._extract_text_for_evaluation(kb_results)
@@ -74,14 +245,10 @@ class DualPathSearcher:
 
     def _extract_text_for_evaluation(self, results: Dict) -> str:
         """从结果中提取文本用于评估"""
-        texts = []
-        
         # 从chunks中提取文本
-        for chunk in results.get("chunks", []):
-            if "text" in chunk:
-                texts.append(chunk["text"])
-        
-        return "\n\n".join(texts)
+        return "\n\n".join(
+            chunk["text"] for chunk in results.get("chunks", []) if "text" in chunk
+        )
 
     def _evaluate_results_with_llm(self, query: str, text1: str, text2: str) -> str:
         """
@@ -120,19 +287,18 @@ class DualPathSearcher:
             # 调用LLM进行评估
             if hasattr(self, "llm"):
                 response = self.llm.invoke(prompt)
-                result = response.content if hasattr(response, "content") else str(response)
+                result = response_text(response)
             else:
                 # 如果没有llm属性，尝试从外部获取
                 from model.get_models import get_llm_model
                 llm = get_llm_model()
                 response = llm.invoke(prompt)
-                result = response.content if hasattr(response, "content") else str(response)
+                result = response_text(response)
             
             # 提取评估结果
-            result = result.strip().lower()
-            if "precise" in result:
+            if _PRECISE_RE.search(result):
                 return "precise"
-            elif "kb" in result:
+            elif _KB_RE.search(result):
                 return "kb"
             else:
                 return "both"
@@ -166,6 +332,7 @@ class DualPathSearcher:
         # 已存在的chunk_id和doc_id集合
         existing_chunk_ids = set(c.get("chunk_id") for c in result["chunks"] if "chunk_id" in c)
         existing_doc_ids = set(d.get("doc_id") for d in result["doc_aggs"] if "doc_id" in d)
+        existing_texts = set(c.get("text") for c in result["chunks"])
         
         # 合并chunks，避免重复
         for chunk in result2.get("chunks", []):
@@ -174,11 +341,13 @@ class DualPathSearcher:
             if chunk_id and chunk_id not in existing_chunk_ids:
                 result["chunks"].append(chunk)
                 existing_chunk_ids.add(chunk_id)
+                existing_texts.add(chunk.get("text"))
             elif not chunk_id:
                 # 如果没有chunk_id，使用内容作为唯一性判断
                 content = chunk.get("text", "")
-                if not any(c.get("text") == content for c in result["chunks"]):
+                if content not in existing_texts:
                     result["chunks"].append(chunk)
+                    existing_texts.add(content)
         
         # 合并doc_aggs，避免重复
         for doc in result2.get("doc_aggs", []):
@@ -202,6 +371,22 @@ class DualPathSearcher:
 class QueryGenerator:
     """查询生成器：生成子查询和跟进查询"""
     
+    # 多假设生成的提示模板与解析正则在类级别共享，避免每次调用重新构建
+    _HYPOTHESES_PROMPT = """
+        为以下问题生成2-3个可能的假设，这些假设应该代表不同角度或思路：
+        
+        问题: "{query}"
+        
+        每个假设应该:
+        1. 不同于其他假设
+        2. 提供一种可能的思考方向
+        3. 有助于深入分析问题
+        
+        以列表形式返回假设，每个假设简短明了。
+        """
+    _NUMBERED_PATTERN = re.compile(r'\d+\.\s*(.*?)(?=\d+\.|$)', re.DOTALL)
+    _DASH_PATTERN = re.compile(r'-\s*(.*?)(?=-|$)', re.DOTALL)
+    
     def __init__(self, llm, sub_query_prompt, followup_query_prompt):
         """
         初始化查询生成器
@@ -225,27 +410,57 @@ class QueryGenerator:
         返回:
             List[str]: 子查询列表
         """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[子查询生成] %.50s", original_query)
+        
         try:
             # 调用LLM生成子查询
             response = self.llm.invoke(self.sub_query_prompt.format(original_query=original_query))
-            content = response.content if hasattr(response, 'content') else str(response)
-            
-            # 提取列表文本
-            list_text = re.search(r'\[.*\]', content, re.DOTALL)
-            if list_text:
-                try:
-                    # 解析列表
-                    sub_queries = eval(list_text.group(0))
-                    return sub_queries
-                except Exception as e:
-                    print(f"[子查询生成] 解析列表失败: {str(e)}")
-            
-            # 如果无法解析，返回原始查询
+            return self._parse_sub_queries(response, original_query)
+        except Exception as e:
+            logger.error("[子查询生成错误] %s", e)
             return [original_query]
+    
+    async def agenerate_sub_queries(self, original_query: str) -> List[str]:
+        """
+        generate_sub_queries 的异步版本，使用 llm.ainvoke 避免阻塞事件循环
+        
+        参数:
+            original_query: 原始用户查询
+            
+        返回:
+            List[str]: 子查询列表
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[子查询生成] %.50s", original_query)
+        
+        try:
+            response = await self.llm.ainvoke(self.sub_query_prompt.format(original_query=original_query))
+            return self._parse_sub_queries(response, original_query)
         except Exception as e:
-            print(f"[子查询生成错误] {str(e)}")
+            logger.error("[子查询生成错误] %s", e)
             return [original_query]
     
+    def _parse_sub_queries(self, response, original_query: str) -> List[str]:
+        """从LLM响应中解析子查询列表，解析失败时返回原始查询"""
+        content = response_text(response)
+        
+        # 提取并解析列表文本
+        try:
+            sub_queries = self._parse_list_literal(content)
+            if sub_queries is not None:
+                return sub_queries
+        except (ValueError, SyntaxError) as e:
+            logger.warning("[子查询生成] 解析列表失败: %s", e)
+        
+        # 尝试按编号列表提取
+        numbered = self._extract_numbered_items(content)
+        if numbered:
+            return numbered
+        
+        # 如果无法解析，返回原始查询
+        return [original_query]
+    
     def generate_multiple_hypotheses(query: str, llm) -> List[str]:
         """
         为查询生成多个假设
@@ -257,36 +472,20 @@ class QueryGenerator:
         Returns:
             List[str]: 假设列表
         """
-        prompt = f"""
-        为以下问题生成2-3个可能的假设，这些假设应该代表不同角度或思路：
-        
-        问题: "{query}"
-        
-        每个假设应该:
-        1. 不同于其他假设
-        2. 提供一种可能的思考方向
-        3. 有助于深入分析问题
-        
-        以列表形式返回假设，每个假设简短明了。
-        """
+        prompt = QueryGenerator._HYPOTHESES_PROMPT.format(query=query)
         
         try:
             response = llm.invoke(prompt)
-            content = response.content if hasattr(response, 'content') else str(response)
-            
-            # 使用正则表达式提取假设
-            import re
+            content = response_text(response)
             
             # 尝试匹配编号列表 (1. xxx 2. xxx)
-            numbered_pattern = re.compile(r'\d+\.\s*(.*?)(?=\d+\.|$)', re.DOTALL)
-            numbered_matches = numbered_pattern.findall(content)
+            numbered_matches = QueryGenerator._NUMBERED_PATTERN.findall(content)
             
             if numbered_matches:
                 return [match.strip() for match in numbered_matches if match.strip()]
             
             # 尝试匹配破折号列表 (- xxx)
-            dash_pattern = re.compile(r'-\s*(.*?)(?=-|$)', re.DOTALL)
-            dash_matches = dash_pattern.findall(content)
+            dash_matches = QueryGenerator._DASH_PATTERN.findall(content)
             
             if dash_matches:
                 return [match.strip() for match in dash_matches if match.strip()]
@@ -298,7 +497,7 @@ class QueryGenerator:
             return potential_hypotheses[:3]  # 最多返回3个假设
             
         except Exception as e:
-            print(f"生成假设失败: {e}")
+            logger.error("生成假设失败: %s", e)
             return []
         
     def generate_followup_queries(self, original_query: str, retrieved_info: List[str]) -> List[str]:
@@ -312,40 +511,105 @@ class QueryGenerator:
         返回:
             List[str]: 跟进查询列表，如果不需要则为空列表
         """
-        # 如果没有检索到任何信息，或信息不足，返回空列表
-        if not retrieved_info or len(retrieved_info) < 2:
+        prompt = self._build_followup_prompt(original_query, retrieved_info)
+        if prompt is None:
             return []
         
         try:
-            # 合并已检索信息（但限制长度）
-            info_text = "\n\n".join(retrieved_info[-3:])  # 只使用最近的3条信息
-            
             # 调用LLM生成跟进查询
-            response = self.llm.invoke(self.followup_query_prompt.format(
-                original_query=original_query,
-                retrieved_info=info_text
-            ))
-            content = response.content if hasattr(response, 'content') else str(response)
-            
-            # 提取列表文本
-            list_text = re.search(r'\[.*\]', content, re.DOTALL)
-            if list_text:
-                try:
-                    # 解析列表
-                    followup_queries = eval(list_text.group(0))
-                    
-                    # 确保没有重复查询
-                    unique_queries = []
-                    for q in followup_queries:
-                        if q not in unique_queries:
-                            unique_queries.append(q)
-                    
-                    return unique_queries
-                except Exception as e:
-                    print(f"[跟进查询生成] 解析列表失败: {str(e)}")
+            response = self.llm.invoke(prompt)
+            return self._parse_followup_queries(response)
+        except Exception as e:
+            logger.error("[跟进查询生成错误] %s", e)
+            return []
+    
+    async def agenerate_followup_queries(self, original_query: str, retrieved_info: List[str]) -> List[str]:
+        """
+        generate_followup_queries 的异步版本，使用 llm.ainvoke 避免阻塞事件循环
+        
+        参数:
+            original_query: 原始查询
+            retrieved_info: 已检索的信息列表
             
-            # 如果无法解析，返回空列表
+        返回:
+            List[str]: 跟进查询列表，如果不需要则为空列表
+        """
+        prompt = self._build_followup_prompt(original_query, retrieved_info)
+        if prompt is None:
             return []
+        
+        try:
+            response = await self.llm.ainvoke(prompt)
+            return self._parse_followup_queries(response)
         except Exception as e:
-            print(f"[跟进查询生成错误] {str(e)}")
-            return []
\ No newline at end of file
+            logger.error("[跟进查询生成错误] %s", e)
+            return []
+    
+    def _build_followup_prompt(self, original_query: str, retrieved_info: List[str]) -> Optional[str]:
+        """
+        构建跟进查询提示，同步和异步版本共用
+        
+        参数:
+            original_query: 原始查询
+            retrieved_info: 已检索的信息列表
+            
+        返回:
+            Optional[str]: 提示文本；已检索信息不足时返回None，表示无需跟进
+        """
+        # 如果没有检索到任何信息，或信息不足，不需要跟进
+        if not retrieved_info or len(retrieved_info) < 2:
+            return None
+        
+        # 合并已检索信息（但限制长度），只使用最近的3条信息
+        info_text = "\n\n".join(retrieved_info[-3:])
+        return self.followup_query_prompt.format(
+            original_query=original_query,
+            retrieved_info=info_text
+        )
+    
+    def _parse_followup_queries(self, response) -> List[str]:
+        """从LLM响应中解析跟进查询列表，解析失败时返回空列表"""
+        content = response_text(response)
+        
+        # 提取并解析列表文本
+        try:
+            followup_queries = self._parse_list_literal(content)
+            if followup_queries is not None:
+                # 确保没有重复查询
+                unique_queries = []
+                for q in followup_queries:
+                    if q not in unique_queries:
+                        unique_queries.append(q)
+                
+                return unique_queries
+        except (ValueError, SyntaxError) as e:
+            logger.warning("[跟进查询生成] 解析列表失败: %s", e)
+        
+        # 尝试按编号列表提取，如果仍无法解析则返回空列表
+        return self._extract_numbered_items(content)
+    
+    @staticmethod
+    def _parse_list_literal(content: str) -> Optional[list]:
+        """
+        安全解析LLM响应中的列表字面量，只接受字面量而不执行任意代码
+        
+        参数:
+            content: LLM响应文本
+            
+        返回:
+            Optional[list]: 解析出的列表；响应中没有列表时返回None
+        """
+        list_text = _LIST_LITERAL_RE.search(content)
+        if not list_text:
+            return None
+        parsed = ast.literal_eval(list_text.group(0))
+        return parsed if isinstance(parsed, list) else None
+    
+    @staticmethod
+    def _extract_numbered_items(content: str) -> List[str]:
+        """提取编号列表中的各项，过滤过短的条目并去重"""
+        unique_items = []
+        for item in _LIST_RE.findall(content):
+            if len(item) > 3 and item not in unique_items:
+                unique_items.append(item)
+        return unique_items
\ No newline at end of file
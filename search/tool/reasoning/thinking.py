@@ -1,14 +1,39 @@
 import re
 import json
 import time
+import asyncio
 from typing import List, Dict, Any
 import logging
 import traceback
+from functools import lru_cache
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 
-from search.tool.reasoning.nlp import extract_between
+from search.tool.reasoning.nlp import extract_between, response_text
 from config.reasoning_prompts import BEGIN_SEARCH_QUERY, BEGIN_SEARCH_RESULT, END_SEARCH_RESULT, REASON_PROMPT, END_SEARCH_QUERY
 
+# 表示推理已可给出答案的标记，合并为一个正则一次扫描完成
+ANSWER_READY_MARKERS = ("**回答**", "足够的信息")
+_ANSWER_READY_RE = re.compile("|".join(map(re.escape, ANSWER_READY_MARKERS)))
+
+@lru_cache(maxsize=None)
+def _reason_system_message() -> SystemMessage:
+    """推理系统提示消息，所有思考引擎共享同一实例"""
+    return SystemMessage(content=REASON_PROMPT)
+
+# 验证状态关键词，忽略大小写匹配，无需复制整段响应做小写转换
+_SUPPORTED_RE = re.compile("support", re.IGNORECASE)
+_REJECTED_RE = re.compile("reject", re.IGNORECASE)
+
+# 分析文本中的结论标记，按优先级排列
+CONCLUSION_MARKERS = ("结论", "总结", "因此", "所以", "综上所述")
+
+# 假设验证状态的显示文本
+VERIFICATION_STATUS_LABELS = {
+    "supported": "✅ 支持",
+    "rejected": "❌ 拒绝",
+    "uncertain": "❓ 不确定"
+}
+
 
 class ThinkingEngine:
     """
@@ -16,17 +41,31 @@ class ThinkingEngine:
     提供思考历史管理和转换功能
     """
     
-    def __init__(self, llm):
+    # 消息与推理步骤模板
+    _QUESTION_TEMPLATE = '问题:"{query}"\n'
+    _CONTINUE_TEXT = "继续基于新信息进行推理分析。\n"
+    _HYPOTHESIS_TEMPLATE = "假设 {index}: {hypothesis}\n理由: {reasoning}\n\n"
+    
+    def __init__(self, llm, max_concurrent_llm: int = 8):
         """
         初始化思考引擎
         
         参数:
             llm: 大语言模型实例，用于生成思考内容
+            max_concurrent_llm: 异步生成查询时允许同时进行的LLM调用数
         """
         self.llm = llm
+        self._llm_semaphore = asyncio.Semaphore(max_concurrent_llm)
+        # 系统提示只构建一次；消息历史以 [系统提示, 初始问题] 作为固定前缀，
+        # 之后只在末尾追加，保证前缀字节稳定以命中LLM服务端的提示缓存
+        self._system_msg = _reason_system_message()
+        self.static_prefix_len = 2
+        # 已发送给LLM的消息数；这部分历史只追加不改写，以便服务端复用前缀的KV缓存
+        self._sent_history_len = 0
         self.all_reasoning_steps = []
         self.msg_history = []
         self.executed_search_queries = []
+        self._executed_query_set = set()  # 与已执行查询列表同步，用于O(1)查重
         self.hypotheses = []       # 存储假设
         self.verification_chain = [] # 验证步骤
         self.reasoning_tree = {}   # 推理树结构
@@ -35,8 +74,10 @@ class ThinkingEngine:
     def initialize_with_query(self, query: str):
         """使用初始查询初始化思考历史"""
         self.all_reasoning_steps = []
-        self.msg_history = [{"role": "user", "content": f'问题:"{query}"\n'}]
+        self.msg_history = [self._system_msg, HumanMessage(content=self._QUESTION_TEMPLATE.format_map({"query": query}))]
+        self._sent_history_len = 0
         self.executed_search_queries = []
+        self._executed_query_set = set()
         self.hypotheses = []
         self.verification_chain = []
         self.reasoning_tree = {"main": []} # 初始化主分支
@@ -55,10 +96,10 @@ class ThinkingEngine:
         
         response = self.llm.invoke([
             {"role": "system", "content": prompt},
-            {"role": "user", "content": self.msg_history[0]["content"]}
+            {"role": "user", "content": self.msg_history[1].content}
         ])
         
-        content = response.content if hasattr(response, 'content') else str(response)
+        content = response_text(response)
         self.add_reasoning_step(content)
         
         return content
@@ -90,7 +131,7 @@ class ThinkingEngine:
         """
         
         response = self.llm.invoke(prompt)
-        content = response.content if hasattr(response, 'content') else str(response)
+        content = response_text(response)
         
         # 解析假设
         try:            
@@ -101,12 +142,7 @@ class ThinkingEngine:
                 self.hypotheses = hypotheses
                 
                 # 添加假设到推理步骤
-                hypothesis_step = "生成的假设：\n"
-                for i, hyp in enumerate(hypotheses):
-                    hypothesis_step += f"假设 {i+1}: {hyp['hypothesis']}\n"
-                    hypothesis_step += f"理由: {hyp['reasoning']}\n\n"
-                
-                self.add_reasoning_step(hypothesis_step)
+                self.add_reasoning_step(self._format_hypotheses_step(hypotheses))
                 return hypotheses
             else:
                 # 使用正则表达式提取假设
@@ -157,15 +193,21 @@ class ThinkingEngine:
         self.hypotheses = hypotheses
         
         # 添加假设到推理步骤
-        hypothesis_step = "生成的假设：\n"
-        for i, hyp in enumerate(hypotheses):
-            hypothesis_step += f"假设 {i+1}: {hyp['hypothesis']}\n"
-            hypothesis_step += f"理由: {hyp['reasoning']}\n\n"
-        
-        self.add_reasoning_step(hypothesis_step)
+        self.add_reasoning_step(self._format_hypotheses_step(hypotheses))
         
         return hypotheses
     
+    def _format_hypotheses_step(self, hypotheses) -> str:
+        """将假设列表格式化为推理步骤文本"""
+        return "生成的假设：\n" + "".join(
+            self._HYPOTHESIS_TEMPLATE.format_map({
+                "index": i + 1,
+                "hypothesis": hyp['hypothesis'],
+                "reasoning": hyp['reasoning']
+            })
+            for i, hyp in enumerate(hypotheses)
+        )
+    
     def verify_hypothesis(self, hypothesis):
         """
         验证假设
@@ -192,7 +234,7 @@ class ThinkingEngine:
         """
         
         response = self.llm.invoke(prompt)
-        verification = response.content if hasattr(response, 'content') else str(response)
+        verification = response_text(response)
         
         # 创建验证结果
         verification_result = {
@@ -236,14 +278,12 @@ class ThinkingEngine:
         
         try:
             response = self.llm.invoke(prompt)
-            status = response.content if hasattr(response, 'content') else str(response)
-            
-            # 清理并标准化状态
-            status = status.strip().lower()
+            status = response_text(response)
             
-            if "support" in status:
+            # 标准化状态
+            if _SUPPORTED_RE.search(status):
                 return "supported"
-            elif "reject" in status:
+            elif _REJECTED_RE.search(status):
                 return "rejected"
             else:
                 return "uncertain"
@@ -345,7 +385,7 @@ class ThinkingEngine:
         """
         
         response = self.llm.invoke(prompt)
-        updated_thinking = response.content if hasattr(response, 'content') else str(response)
+        updated_thinking = response_text(response)
         
         # 添加到推理步骤
         self.add_reasoning_step(f"更新后的思考:\n\n{updated_thinking}")
@@ -377,12 +417,7 @@ class ThinkingEngine:
         
         integrated_thinking += "## 假设验证\n\n"
         for i, ver in enumerate(verifications):
-            status_map = {
-                "supported": "✅ 支持",
-                "rejected": "❌ 拒绝", 
-                "uncertain": "❓ 不确定"
-            }
-            status = status_map.get(ver["status"], "未知")
+            status = VERIFICATION_STATUS_LABELS.get(ver["status"], "未知")
             
             integrated_thinking += f"### 验证 {i+1}: {ver['hypothesis']} [{status}]\n"
             integrated_thinking += f"{ver['verification']}\n\n"
@@ -425,9 +460,8 @@ class ThinkingEngine:
         # 创建新分支
         self.reasoning_tree[branch_name] = []
         
-        # 复制基础分支内容
-        for step in self.reasoning_tree[base_branch]:
-            self.reasoning_tree[branch_name].append(step.copy())
+        # 共享基础分支的步骤记录（步骤创建后不再修改，无需逐个复制）
+        self.reasoning_tree[branch_name].extend(self.reasoning_tree[base_branch])
             
         # 切换到新分支
         self.current_branch = branch_name
@@ -470,16 +504,11 @@ class ThinkingEngine:
         target_steps = self.reasoning_tree[target_branch]
         
         # 找出源分支中独有的步骤
-        source_unique_steps = []
-        target_step_contents = [step["content"] for step in target_steps]
-        
-        for step in source_steps:
-            if step["content"] not in target_step_contents:
-                source_unique_steps.append(step)
+        target_step_contents = {step["content"] for step in target_steps}
+        source_unique_steps = [step for step in source_steps if step["content"] not in target_step_contents]
         
         # 将源分支独有步骤添加到目标分支
-        for step in source_unique_steps:
-            self.reasoning_tree[target_branch].append(step.copy())
+        self.reasoning_tree[target_branch].extend(source_unique_steps)
             
         # 添加合并记录
         merged_step = {
@@ -520,7 +549,7 @@ class ThinkingEngine:
         """
         
         response = self.llm.invoke(prompt)
-        counter_analysis = response.content if hasattr(response, 'content') else str(response)
+        counter_analysis = response_text(response)
         
         # 添加分析结果
         self.add_reasoning_step(f"反事实分析结果:\n\n{counter_analysis}")
@@ -537,7 +566,7 @@ class ThinkingEngine:
         """
         
         response = self.llm.invoke(prompt)
-        comparison = response.content if hasattr(response, 'content') else str(response)
+        comparison = response_text(response)
         
         # 添加比较结果
         self.add_reasoning_step(f"原始推理与反事实推理对比:\n\n{comparison}")
@@ -561,9 +590,7 @@ class ThinkingEngine:
             str: 提取的结论
         """
         # 查找结论标记
-        conclusion_markers = ["结论", "总结", "因此", "所以", "综上所述"]
-        
-        for marker in conclusion_markers:
+        for marker in CONCLUSION_MARKERS:
             marker_index = analysis.find(marker)
             if marker_index != -1:
                 # 提取标记后的内容作为结论
@@ -631,53 +658,83 @@ class ThinkingEngine:
             Dict: 包含查询和状态信息的字典
         """
         # 使用LLM进行推理分析，获取下一个搜索查询
-        formatted_messages = [SystemMessage(content=REASON_PROMPT)] + self.msg_history
+        try:
+            # 调用LLM生成查询（消息历史已包含固定的系统提示前缀）
+            self._sent_history_len = len(self.msg_history)
+            msg = self.llm.invoke(self.msg_history)
+            return self._handle_next_query_response(msg)
+        except Exception as e:
+            error_msg = f"生成查询时出错: {str(e)}\n{traceback.format_exc()}"
+            logging.error(error_msg)
+            return {"status": "error", "error": error_msg, "queries": []}
+    
+    async def agenerate_next_query(self) -> Dict[str, Any]:
+        """
+        generate_next_query 的异步版本，使用 llm.ainvoke 且受并发信号量限制
         
+        返回:
+            Dict: 包含查询和状态信息的字典
+        """
         try:
-            # 调用LLM生成查询
-            msg = self.llm.invoke(formatted_messages)
-            query_think = msg.content if hasattr(msg, 'content') else str(msg)
-            
-            # 清理响应
-            query_think = re.sub(r"<think>.*</think>", "", query_think, flags=re.DOTALL)
-            if not query_think:
-                return {"status": "empty", "content": None, "queries": []}
-                
-            # 更新思考过程
-            clean_think = self.remove_query_tags(query_think)
-            self.add_reasoning_step(query_think)
-            
-            # 从AI响应中提取搜索查询
-            queries = self.extract_queries(query_think)
-            
-            # 如果没有生成搜索查询，检查是否应该结束
-            if not queries:
-                # 检查是否包含最终答案标记
-                if "**回答**" in query_think or "足够的信息" in query_think:
-                    return {
-                        "status": "answer_ready", 
-                        "content": query_think,
-                        "queries": []
-                    }
-                
-                # 没有明确结束标志，就继续
+            async with self._llm_semaphore:
+                self._sent_history_len = len(self.msg_history)
+                msg = await self.llm.ainvoke(self.msg_history)
+            return self._handle_next_query_response(msg)
+        except Exception as e:
+            error_msg = f"生成查询时出错: {str(e)}\n{traceback.format_exc()}"
+            logging.error(error_msg)
+            return {"status": "error", "error": error_msg, "queries": []}
+    
+    def _handle_next_query_response(self, msg) -> Dict[str, Any]:
+        """
+        处理LLM返回的推理内容，记录推理步骤并提取查询
+        
+        参数:
+            msg: LLM响应
+            
+        返回:
+            Dict: 包含查询和状态信息的字典
+        """
+        query_think = response_text(msg)
+        
+        # 清理响应
+        query_think = re.sub(r"<think>.*</think>", "", query_think, flags=re.DOTALL)
+        if not query_think:
+            return {"status": "empty", "content": None, "queries": []}
+            
+        # 更新思考过程
+        self.add_reasoning_step(query_think)
+        
+        # 从AI响应中提取搜索查询
+        queries = self.extract_queries(query_think)
+        
+        # 如果没有生成搜索查询，检查是否应该结束
+        if not queries:
+            # 检查是否包含最终答案标记
+            if self._is_answer_ready(query_think):
                 return {
-                    "status": "no_query", 
+                    "status": "answer_ready", 
                     "content": query_think,
                     "queries": []
                 }
             
-            # 有查询，继续搜索
+            # 没有明确结束标志，就继续
             return {
-                "status": "has_query", 
+                "status": "no_query", 
                 "content": query_think,
-                "queries": queries
+                "queries": []
             }
-            
-        except Exception as e:
-            error_msg = f"生成查询时出错: {str(e)}\n{traceback.format_exc()}"
-            logging.error(error_msg)
-            return {"status": "error", "error": error_msg, "queries": []}
+        
+        # 有查询，继续搜索
+        return {
+            "status": "has_query", 
+            "content": query_think,
+            "queries": queries
+        }
+    
+    def _is_answer_ready(self, content: str) -> bool:
+        """检查推理内容是否包含可以给出最终答案的标记"""
+        return _ANSWER_READY_RE.search(content) is not None
     
     def add_ai_message(self, content: str):
         """
@@ -699,26 +756,19 @@ class ThinkingEngine:
     
     def update_continue_message(self):
         """更新最后的消息，请求继续推理"""
-        if len(self.msg_history) > 0:
-            # 检查最后一条消息的类型
-            last_message = self.msg_history[-1]
-            
-            if isinstance(last_message, dict) and "role" in last_message:
-                # 处理字典类型的消息
-                if last_message["role"] == "assistant":
-                    self.add_human_message("继续基于新信息进行推理分析。\n")
-                else:
-                    # 更新最后的用户消息
-                    last_content = last_message.get("content", "")
-                    self.msg_history[-1] = {"role": "user", "content": last_content + "\n\n继续基于新信息进行推理分析。\n"}
-            else:
-                # 处理对象类型的消息 (如AIMessage, HumanMessage等)
-                if hasattr(last_message, "role") and last_message.role == "assistant":
-                    self.add_human_message("继续基于新信息进行推理分析。\n")
-                elif hasattr(last_message, "content"):
-                    # 更新最后的用户消息
-                    last_content = last_message.content
-                    self.msg_history[-1] = {"role": "user", "content": last_content + "\n\n继续基于新信息进行推理分析。\n"}
+        if not self.msg_history:
+            return
+        
+        continue_text = self._CONTINUE_TEXT
+        last_message = self.msg_history[-1]
+        
+        # 固定前缀、已发送过的消息和AI消息都不改写，只在末尾追加新的用户消息
+        sent_len = max(self.static_prefix_len, self._sent_history_len)
+        if len(self.msg_history) <= sent_len or not isinstance(last_message, HumanMessage):
+            self.add_human_message(continue_text)
+        else:
+            # 末尾尚未发送的用户消息，直接并入继续推理的请求
+            self.msg_history[-1] = HumanMessage(content=last_message.content + "\n\n" + continue_text)
         
     def prepare_truncated_reasoning(self) -> str:
         """
@@ -799,7 +849,7 @@ class ThinkingEngine:
         返回:
             bool: 是否已执行过
         """
-        return query in self.executed_search_queries
+        return query in self._executed_query_set
     
     def add_executed_query(self, query: str):
         """
@@ -808,4 +858,5 @@ class ThinkingEngine:
         参数:
             query: 已执行的查询字符串
         """
-        self.executed_search_queries.append(query)
\ No newline at end of file
+        self.executed_search_queries.append(query)
+        self._executed_query_set.add(query)
\ No newline at end of file
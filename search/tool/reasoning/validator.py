@@ -1,4 +1,19 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
+import re
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# 表明答案生成失败的错误模式
+ERROR_PATTERNS = (
+    "抱歉，处理您的问题时遇到了错误",
+    "技术原因:",
+    "无法获取",
+    "无法回答这个问题",
+    "没有找到相关信息",
+    "对不起，我不能"
+)
 
 class AnswerValidator:
     """
@@ -13,16 +28,27 @@ class AnswerValidator:
             keyword_extractor: 用于提取关键词的函数或对象
         """
         self.keyword_extractor = keyword_extractor
-        self.error_patterns = [
-            "抱歉，处理您的问题时遇到了错误",
-            "技术原因:",
-            "无法获取",
-            "无法回答这个问题",
-            "没有找到相关信息",
-            "对不起，我不能"
-        ]
+        self.error_patterns = list(ERROR_PATTERNS)
+        self._compiled_patterns = None
+        self._error_pattern_re = None
     
-    def validate(self, query: str, answer: str) -> Dict[str, bool]:
+    def _get_error_pattern_re(self) -> "re.Pattern":
+        """
+        获取匹配任一错误模式的正则，error_patterns被修改后自动重新编译
+        
+        返回:
+            re.Pattern: 所有错误模式合并后的正则，一次扫描即可完成检测
+        """
+        patterns = tuple(self.error_patterns)
+        if patterns != self._compiled_patterns:
+            # 没有错误模式时使用永不匹配的正则，避免空模式匹配任意文本
+            self._error_pattern_re = re.compile(
+                "|".join(map(re.escape, patterns)) if patterns else r"(?!)"
+            )
+            self._compiled_patterns = patterns
+        return self._error_pattern_re
+    
+    def validate(self, query: str, answer: str) -> Dict[str, Optional[bool]]:
         """
         验证生成答案的质量
         
@@ -31,28 +57,44 @@ class AnswerValidator:
             answer: 生成的答案
             
         返回:
-            Dict[str, bool]: 各项验证的结果
+            Dict[str, Optional[bool]]: 各项验证的结果，未执行的检查为None
         """
+        # 空答案直接判定失败，无需提取关键词
+        if not answer or not answer.strip():
+            logger.info("[验证] 答案为空")
+            return {
+                "length": False,
+                "no_error_patterns": True,
+                "keyword_relevance": None,
+                "passed": False
+            }
+        
         results = {}
         
         # 检查最小长度
         results["length"] = len(answer) >= 50
         if not results["length"]:
-            print(f"[验证] 答案太短: {len(answer)}字符")
+            logger.info("[验证] 答案太短: %d字符", len(answer))
         
         # 检查是否包含错误模式
-        results["no_error_patterns"] = not any(pattern in answer for pattern in self.error_patterns)
-        if not results["no_error_patterns"]:
-            for pattern in self.error_patterns:
-                if pattern in answer:
-                    print(f"[验证] 答案包含错误模式: {pattern}")
-                    break
+        error_match = self._get_error_pattern_re().search(answer)
+        results["no_error_patterns"] = error_match is None
+        if error_match:
+            logger.info("[验证] 答案包含错误模式: %s", error_match.group(0))
         
-        # 关键词相关性检查
-        results["keyword_relevance"] = self._check_keyword_relevance(query, answer)
+        # 关键词相关性检查需要提取关键词，代价最高；
+        # 前面的检查已失败时结果必然不通过，直接跳过并记为None（未检查）
+        if results["length"] and results["no_error_patterns"]:
+            results["keyword_relevance"] = self._check_keyword_relevance(query, answer)
+        else:
+            results["keyword_relevance"] = None
         
-        # 总体通过验证
-        results["passed"] = all(results.values())
+        # 总体通过验证：所有检查均已执行且通过
+        results["passed"] = (
+            results["length"]
+            and results["no_error_patterns"]
+            and results["keyword_relevance"] is True
+        )
         
         return results
     
@@ -79,23 +121,39 @@ class AnswerValidator:
         high_level_keywords = keywords.get("high_level", [])
         low_level_keywords = keywords.get("low_level", [])
         
+        # 答案只转换一次小写，避免每个关键词都复制一遍答案
+        answer_lower = answer.lower()
+        
         # 至少有一个高级关键词应该在答案中出现
         if high_level_keywords:
-            keyword_found = any(keyword.lower() in answer.lower() for keyword in high_level_keywords)
+            keyword_found = any(keyword.lower() in answer_lower for keyword in high_level_keywords)
             if not keyword_found:
-                print(f"[验证] 答案未包含任何高级关键词: {high_level_keywords}")
+                logger.info("[验证] 答案未包含任何高级关键词: %s", high_level_keywords)
                 return False
                 
         # 至少有一半的低级关键词应该在答案中出现
         if low_level_keywords and len(low_level_keywords) > 1:
-            matches = sum(1 for keyword in low_level_keywords if keyword.lower() in answer.lower())
+            matches = sum(1 for keyword in low_level_keywords if keyword.lower() in answer_lower)
             if matches < len(low_level_keywords) / 2:
-                print(f"[验证] 答案未包含足够的低级关键词: {matches}/{len(low_level_keywords)}")
+                logger.info("[验证] 答案未包含足够的低级关键词: %d/%d", matches, len(low_level_keywords))
                 return False
         
-        print("[验证] 答案通过关键词相关性检查")
+        logger.debug("[验证] 答案通过关键词相关性检查")
         return True
 
+# 识别复杂问题的关键词
+COMPLEXITY_INDICATORS = (
+    "为什么", "如何", "机制", "原因", "关系", "比较", "区别",
+    "影响", "分析", "评估", "预测", "如果", "假设", "还是",
+    "多少", "怎样", "多大", "是否", "哪些", "优缺点"
+)
+QUESTION_MARKS = frozenset("?？")
+# 关键词和问号合并为一个模式，一次扫描同时找出查询中的关键词和问号；
+# 用前瞻匹配每个位置，首尾重叠的关键词（如"还是否"）也都能找到
+_COMPLEXITY_SIGNAL_RE = re.compile(
+    "(?=(" + "|".join(map(re.escape, COMPLEXITY_INDICATORS)) + "|[?？]))"
+)
+
 def complexity_estimate(query: str) -> float:
     """
     估计查询复杂度
@@ -108,7 +166,7 @@ def complexity_estimate(query: str) -> float:
     """
     # 添加None检查和类型验证
     if query is None:
-        print(f'complexity_estimate: 返回0，因为query:{query}为空\n')
+        logger.debug("complexity_estimate: 返回0，因为query:%r为空", query)
         return 0.0
     
     # 确保query是字符串
@@ -117,24 +175,35 @@ def complexity_estimate(query: str) -> float:
     
     # 如果查询为空，返回0
     if not query.strip():
-        print(f'complexity_estimate: 返回0，因为query:{query}为空\n')
+        logger.debug("complexity_estimate: 返回0，因为query:%r为空", query)
         return 0.0
     
+    return _estimate_complexity(query)
+
+@lru_cache(maxsize=1024)
+def _estimate_complexity(query: str) -> float:
+    """
+    计算非空查询的复杂度评分
+
+    评分只取决于查询文本，同一查询在一次研究中会被多次估计，结果直接复用
+    
+    Args:
+        query: 非空查询字符串
+        
+    Returns:
+        float: 复杂度评分(0.0-1.0)
+    """
     try:
         # 基于查询长度、问号数量和关键词数量的简单启发式方法
         length_factor = min(1.0, len(query) / 100)
-        question_marks = query.count("?") + query.count("？")
-        question_factor = min(1.0, question_marks * 0.2)
         
-        # 识别复杂问题的关键词
-        complexity_indicators = [
-            "为什么", "如何", "机制", "原因", "关系", "比较", "区别",
-            "影响", "分析", "评估", "预测", "如果", "假设", "还是",
-            "多少", "怎样", "多大", "是否", "哪些", "优缺点"
-        ]
+        # 一次扫描取出所有问号和关键词
+        signals = _COMPLEXITY_SIGNAL_RE.findall(query)
+        question_marks = sum(1 for signal in signals if signal in QUESTION_MARKS)
+        question_factor = min(1.0, question_marks * 0.2)
         
-        # 检查关键词
-        indicator_count = sum(1 for indicator in complexity_indicators if indicator in query)
+        # 检查关键词，统计出现过的不同关键词个数
+        indicator_count = len(set(signals) - QUESTION_MARKS)
         indicator_factor = min(1.0, indicator_count * 0.15)
         
         # 综合评分
@@ -145,5 +214,5 @@ def complexity_estimate(query: str) -> float:
             return 0.5  # 默认中等复杂度
             
     except Exception as e:
-        print(f"计算查询复杂度时出错: {e}")
+        logger.error("计算查询复杂度时出错: %s", e)
         return 0.5  # 出错时返回默认值
\ No newline at end of file